@@ -1,52 +1,26 @@
+import os
+import sys
 import math
 import time
-from copy import deepcopy
+import random
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, TimeoutError
 from policy import *
-
-
-class TreeNode(object):
-    '''
-        A node in the MCTS tree.
-        Each node keeps track of its own value Q, prior probability P, and
-        its visit-count-adjusted prior score U.
-    '''
-    def __init__(self, parent, prior_P):
-        self.parent = parent
-        self.P = prior_P    # prior probability for winning
-        self.children = dict()
-        self.visits = 0     # number of visits
-        self.Q = 0          # Q-value (exploitation)
-        self.U = 0          # visit-count-adjusted prior score (exploration)
-
-    def select(self, c_puct):
-        # selection stage
-        return max(self.children.items(), key=lambda x: x[1].get_value(c_puct))
-
-    def expand(self, action_prob):
-        # expansion stage
-        for action, prob in action_prob:
-            if action not in self.children:
-                self.children[action] = TreeNode(self, prob)
-
-    def update_recursive(self, leaf_value):
-        if self.parent:
-            self.parent.update_recursive(-leaf_value)
-        self.visits += 1
-        self.Q += (leaf_value - self.Q) / self.visits   # running average
-
-    def get_value(self, c_puct):
-        self.U = (c_puct * self.P * math.sqrt(self.parent.visits) / (1 + self.visits))
-        return self.Q + self.U
-
-    def is_leaf(self):
-        return len(self.children) == 0
-
-    def is_root(self):
-        return self.parent is None
+from position import Position
+from zobrist import TranspositionTable, SymmetricHash
+from nodes import NodeStore
+from timemanager import TimeManager
+from rollout import rollout_engine, engine_bytes
+from utils import line_cache, budget_line_cache
+from threatspace import ThreatSpaceSearch
+from dfpn import DfpnSolver
 
 
 class RHMCTS(object):
-    def __init__(self, policy_value_fn, c_puct=5, max_depth=5):
+    def __init__(self, policy_value_fn, c_puct=5, max_depth=None, tt_size=200000, tt_replacement="lru", workers=1,
+                 virtual_loss=1., processes=1, rollout_workers=0, max_memory=0, batch_rollouts=True,
+                 dfpn_nodes=20000, dfpn_threats=6, dfpn_time=0.25, dfpn_tt_size=100000):
         """
         :param policy_value_fn: a function that takes in a board state and outputs
             a list of (action, probability) tuples and also a score in [-1, 1]
@@ -56,68 +30,190 @@ class RHMCTS(object):
             converges to the maximum-value policy. A higher value means
             relying on the prior more.
         :param num_simu: number of simulations.
+        :param max_depth: the most playouts of a move, None to run playouts until the deadline.
+        :param tt_size: the number of nodes kept in the transposition table, which lets the
+            transpositions of a position share one node (and its statistics).
+        :param tt_replacement: the replacement policy of the table, "lru" or "visits".
+        :param workers: the number of threads running playouts on the tree at the same time.
+        :param virtual_loss: the loss a node counts for while a playout through it is running,
+            which makes the threads spread out over the tree.
+        :param processes: the number of worker processes growing independent trees from the same
+            root, whose root statistics are merged (root parallelization). The processes are
+            started on the first search and kept until close().
+        :param rollout_workers: the number of worker processes running the rollouts after an
+            expansion as one batch (leaf parallelization), 0 to run them in the playout.
+        :param max_memory: the bytes the search may take, 0 for no limit, see set_max_memory.
+        :param batch_rollouts: run the rollouts after an expansion together on the vectorized
+            RolloutEngine, unless they go to rollout_workers.
+        :param dfpn_nodes: the node budget of the df-pn solver run before the search, 0 not to run it.
+        :param dfpn_threats: the least number of cells making a four or an open three, for either
+            player, for which the solver is run.
+        :param dfpn_time: the share of the time of the move the solver may take.
+        :param dfpn_tt_size: the number of nodes kept in the transposition table of the solver.
         """
-        self.root = TreeNode(None, 1.0)
+        self.nodes = NodeStore(virtual_loss=virtual_loss)
+        self.root = self.nodes.new_node(1.0)
         self.policy = policy_value_fn
         self.c_puct = c_puct
         self.max_depth = max_depth
+        self.tt = TranspositionTable(tt_size, tt_replacement, visits=lambda node: self.nodes.visits[node])
+        self.workers = workers
+        self.executor = None
+        self.processes = processes
+        self.pool = None
+        self.rollout_workers = rollout_workers
+        self.rollout_pool = None
+        self.batch_rollouts = batch_rollouts
+        self.dfpn_nodes = dfpn_nodes
+        self.dfpn_threats = dfpn_threats
+        self.dfpn_time = dfpn_time
+        self.dfpn_tt_size = dfpn_tt_size
+        self.dfpn_tt_maxsize = dfpn_tt_size     # within the memory budget
+        self.dfpn_bytes = 0     # the table of the last solver
+        self.root_moves = None  # the moves the root search is limited to, by the last prove()
+        self.ponder_thread = None
+        self.ponder_stop = None
+        self.root_key = None    # the key of the root position, if known
+        self.previous = None    # the root one ply back, kept until the next move so that a takeback finds it
+        self.tt_size = tt_size
+        self.set_max_memory(max_memory)
         # self.moved = []
         # self.adjancent = []
 
-    def playout(self, state, num_simu=3):
-        board, player = state
+    def playout(self, position, num_simu=3):
+        """
+        :param position: the Position of the root, made and unmade in place and left as it was
+        """
+        ply = position.ply()
+        board = position.board
+        symmetry = position.symmetry    # the edges of a node are moves of its canonical board
+        nodes = self.nodes
         node = self.root
-
-        # selection: find out the leaf node to be expand
-        end = False
-        while not node.is_leaf():
-            (action_x, action_y), node = node.select(self.c_puct)
-            board[action_x][action_y] = player
-            player = 1 if player == 2 else 2    # switch player
-            end = self.isTerminal(board, action_x, action_y, player)
-
-        if end is False:
-            # expansion: expand the best n substates.
-            action_prob = self.policy((board, player))
-            node.expand(action_prob)
-            # simulation
-            opponent = 1 if player == 2 else 2    # switch player
-            for i in range(num_simu):
-                for act, _ in action_prob:
-                    new_board = deepcopy(board)
-                    new_board[act[0]][act[1]] = player
-                    winner = self.simulate((new_board, opponent))   # 0 for a tie, 1 for P1, 2 for P2
-                    print(winner)
+        path = [node]   # the tree is a DAG, so backpropagate along the path taken
+        with nodes.lock:
+            nodes.add_virtual(node)
+
+        try:
+            # selection: find out the leaf node to be expand
+            end = False
+            while True:
+                with nodes.lock:
+                    if nodes.is_leaf(node):
+                        break
+                    move, node = nodes.select(node, self.c_puct)
+                    nodes.add_virtual(node)
+                    path.append(node)
+                action_x, action_y = symmetry.from_canonical(move, symmetry.canonical()[1])
+                position.make((action_x, action_y))
+                end = self.isTerminal(board, action_x, action_y, position.player)
+            player = position.player
+
+            if end is False:
+                # expansion: expand the best n substates.
+                action_prob = self.policy((board, player), position.frontier)
+                frame = symmetry.canonical()[1]
+                with nodes.lock:
+                    # unless another thread expanded it meanwhile, or the memory is used up and only the
+                    # statistics of the leaf are updated
+                    if nodes.is_leaf(node) and nodes.room(len(action_prob)):
+                        nodes.expand(node, [(symmetry.to_canonical(action, frame), prob) for action, prob in action_prob],
+                                     lambda action, prob: self.transposition(
+                                         position, symmetry.from_canonical(action, frame), prob))
+                # simulation
+                opponent = 1 if player == 2 else 2    # switch player
+                actions = [act for i in range(num_simu) for act, _ in action_prob]
+                for act, winner in self.rollouts(position, actions):   # winner: 0 for a tie, 1 for P1, 2 for P2
+                    # print(winner)
                     # backpropagation
                     leaf_value = -1 if winner == opponent else winner
                     # print(act)
                     # print(leaf_value)
-                    node.children[act].update_recursive(leaf_value)
-
-        elif end is True:
-            node.update_recursive(1.)
-        else:  # end == -1 (tie)
-            node.update_recursive(0.)
-
-    def simulate(self, state, limit_depth=50):
-        # simulation stage
-        board, player = state
-        # adjacent = self.adjancent
-        # moved = self.moved  # the coordinates placed by chess piece
+                    with nodes.lock:
+                        child = nodes.find_child(node, symmetry.to_canonical(act, frame))
+                        if child is not None:
+                            nodes.update_path(path + [child], leaf_value)
+                        else:
+                            nodes.update_path(path, -leaf_value)
+
+            elif end is True:
+                with nodes.lock:
+                    nodes.update_path(path, 1.)
+            else:  # end == -1 (tie)
+                with nodes.lock:
+                    nodes.update_path(path, 0.)
+        finally:
+            with nodes.lock:
+                nodes.release_virtual(path)
+            position.unmake_to(ply)
+
+    def transposition(self, position, action, prob):
+        # the node reached by action, shared with the other paths to the same position and its
+        # rotations and reflections
+        key = position.canonical_child_key(action)[0]
+        node = self.tt.get(key)
+        if node is None:
+            node = self.nodes.new_node(prob)
+            self.tt.put(key, node)
+        return node
+
+    def rollouts(self, position, actions):
+        """
+        simulate the game once after each action of actions
+        :return: a generator of (action, winner), in the order the rollouts finish
+        """
+        if self.rollout_workers <= 0 and self.batch_rollouts:
+            height, width = len(position.board), len(position.board[0])
+            cells = [x * width + y for x, y in actions]
+            winners = rollout_engine(height, width).run(position.rollout, position.player, cells, deadline=time_end)
+            for act, winner in zip(actions, winners):
+                yield act, int(winner)
+            return
+        if self.rollout_workers <= 0:
+            for act in actions:
+                position.make(act)
+                winner = self.simulate(position)
+                position.unmake()
+                yield act, winner
+            return
+
+        if self.rollout_pool is None:
+            self.rollout_pool = ProcessPoolExecutor(self.rollout_workers, initializer=_worker_init,
+                                                    initargs=(len(position.board),))
+        rows = [list(row) for row in position.board]
+        futures = dict()
+        for act in actions:
+            job = (rows, position.player, act, time_end, random.getrandbits(32))
+            futures[self.rollout_pool.submit(_rollout, job)] = act
+        try:
+            for future in as_completed(futures, timeout=max(0., time_end - time.time())):
+                yield futures[future], future.result()
+        except TimeoutError:
+            pass    # the move is due, the rollouts still running are dropped
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def simulate(self, position, limit_depth=50):
+        # simulation stage on a copy of the rollout board of position, which is left as it was
+        rollout = position.rollout.copy()
+        player = position.player
         for depth in range(limit_depth):
             if time.time() > time_end:
                 return 0
-            x, y = simulation_policy((board, player))
-            board[x][y] = player
-            # moved.append((x, y))
-            # adjacent = self.updata_adjacent(moved, adjacent, (x,y))
-            end = self.isTerminal(board, x, y, player)
-            if end is True:
+            c = rollout.choose_cell(player)
+            if c is None:   # tie
+                return 0
+            if rollout.play_cell(c, player):
                 return player
-            player = 1 if player == 2 else 2  # switch player
+            player = 3 - player
         return 0
 
     def isTerminal(self, board, x, y, player):
+        if isinstance(board, BitBoard):
+            if board.has_five(x, y, player):
+                return True
+            # tie (-1) or not terminal (False)
+            return -1 if board.is_full() else False
         boardLength = len(board)
         # column
         d_start = max(-1 * x, -4)
@@ -152,25 +248,18 @@ class RHMCTS(object):
                 return False
         return -1
 
-    def get_action(self, board):
+    def get_action(self, board, timer=None):
+        """
+        :param timer: the TimeManager of the move, which may give more time to an unstable position
+        """
+        global time_end
+        if time_end != -1:
+            action = self.prove(board)
+            if action is not None:
+                return action
 
-        action = heuristic1(board, 1)
-        if action is not None:
-            return action
-        action = heuristic1(board, 2)
-        if action is not None:
-            return action
-        action = heuristic2(board, 1)
-        if action is not None:
-            return action
-        action = heuristic2_op(board, 2)
-        if action is not None:
-            return action
-        action = heuristic3(board, 1)
-        if action is not None:
-            return action
-        action = heuristic3(board, 2)
-        if action is not None:
+        action = threat_action(board, 1)
+        if action is not None and (self.root_moves is None or action in self.root_moves):
             return action
 
         # actions = policy_evaluation_function((board, 1))
@@ -180,22 +269,291 @@ class RHMCTS(object):
             actions = policy_evaluation_function((board, 1))
             return max(actions, key=lambda x: x[1])[0]
 
-        for n in range(self.max_depth):
-            state_copy = deepcopy((board, 1))  # we are player 1
-            self.playout(state_copy)
-            if time.time() > time_end:
-                break
-        # print(self.root.children.items())
-        return max(self.root.children.items(), key=lambda x: x[1].Q)[0]
-
-    def update_with_move(self, last_move):
-        # self.moved.append(last_move)
-        # self.adjancent = self.updata_adjacent(self.moved, self.adjancent, last_move)
-        # Step forward in the tree, keeping everything we already know about the subtree.
-        if last_move in self.root.children:
-            self.root = self.root.children[last_move]
+        if self.root_moves is not None:
+            self.restrict_root(board, self.root_moves)
+        self.search(board)
+        if timer is not None and self.unstable() and timer.extend():
+            time_end = timer.deadline
+            self.search(board)
+        if self.nodes.is_leaf(self.root):     # out of time before the first playout
+            actions = policy_evaluation_function((board, 1))
+            return max(actions, key=lambda x: x[1])[0]
+        # print(self.nodes.children(self.root))
+        return self.root_move(board, self.nodes.best_child(self.root)[0])
+
+    @staticmethod
+    def root_move(board, move):
+        # the move of board for a move of the root, which is a move of the canonical board
+        symmetry = SymmetricHash(board)
+        return symmetry.from_canonical(move, symmetry.canonical()[1])
+
+    def prove(self, board):
+        """
+        df-pn on the threats of both players, when there are many
+        :return: the move of a proven result, or None: the first move of a proven win, or the only
+            move not proven to lose against a proven threat of the opponent; when there are several
+            such moves, the search of the root is limited to them (root_moves)
+        """
+        self.root_moves = None
+        if self.dfpn_nodes <= 0:
+            return None
+        solver = DfpnSolver(board, self.dfpn_tt_maxsize)
+        if solver.threat_count() < self.dfpn_threats:
+            return None
+        deadline = time.time() + max(0., time_end - time.time()) * self.dfpn_time
+        try:
+            proven, line = solver.prove(1, deadline, self.dfpn_nodes)
+            if proven:
+                return line[0]
+            proven, line = solver.prove(2, deadline, self.dfpn_nodes)
+            if not proven:
+                return None
+            moves = solver.refutations(1, line, deadline, self.dfpn_nodes)
+        finally:
+            self.dfpn_bytes = solver.tt.nbytes()
+        if len(moves) == 1:
+            return moves[0]
+        if len(moves) > 1:
+            self.root_moves = moves
+        return None     # every move loses, or several moves hold and the search picks one
+
+    def restrict_root(self, board, moves):
+        """
+        search only moves at the root: the tree is started again with them as the only children of the root
+        """
+        position = Position(board, 1)
+        symmetry = position.symmetry
+        frame = symmetry.canonical()[1]
+        priors = dict(self.policy((position.board, 1), position.frontier))
+        self.reset(self.root_key)
+        with self.nodes.lock:
+            self.nodes.expand(self.root, [(symmetry.to_canonical(move, frame), priors.get(move, 1. / len(moves)))
+                                          for move in moves],
+                              lambda action, prob: self.transposition(position, symmetry.from_canonical(action, frame),
+                                                                      prob))
+
+    def unstable(self):
+        # the child with the best Q is not the most visited one, so the search has not settled yet
+        nodes = self.nodes
+        if nodes.is_leaf(self.root):
+            return False
+        children = nodes.children(self.root)
+        most_visited = max(children, key=lambda x: nodes.visits[x[1]])[0]
+        return most_visited != nodes.best_child(self.root)[0]
+
+    def search(self, board):
+        # playouts from board until time_end (or max_depth of them), shared between the worker threads
+        if self.processes > 1:
+            self.merge_root(self.root_parallel(board), board)
+            return
+        if self.workers <= 1:
+            position = Position(board, 1)  # we are player 1
+            n = 0
+            while self.max_depth is None or n < self.max_depth:
+                self.make_room()
+                self.playout(position)
+                n += 1
+                if time.time() > time_end:
+                    break
+            return
+
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(self.workers)
+        self.make_room()    # node ids change when nodes are freed, so not while the threads search
+        lock = threading.Lock()
+        left = [self.max_depth]
+
+        def work():
+            position = Position(board, 1)  # every thread makes its moves on its own position
+            while time.time() <= time_end:
+                if left[0] is not None:
+                    with lock:
+                        if left[0] <= 0:
+                            return
+                        left[0] -= 1
+                self.playout(position)
+
+        for future in [self.executor.submit(work) for _ in range(self.workers)]:
+            future.result()
+
+    def root_parallel(self, board):
+        """
+        grow one independent tree from board in every worker process, until the same deadline
+        :return: a list of [(action, prior, visits, Q)] of the root children, one list per process
+        """
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(self.processes, initializer=_worker_init, initargs=(len(board),))
+        rows = [list(row) for row in board]
+        jobs = [(rows, time_end, self.policy, self.c_puct, self.max_depth, self.workers, self.max_memory // self.processes,
+                 random.getrandbits(32)) for _ in range(self.processes)]
+        return self.pool.map(_root_search, jobs)
+
+    def merge_root(self, results, board):
+        # add the visits of the root children over all trees to this tree, and average Q by the visits
+        symmetry = SymmetricHash(board)
+        frame = symmetry.canonical()[1]
+        stats = dict()
+        for children in results:
+            for action, prior, visits, Q in children:
+                action = symmetry.to_canonical(action, frame)
+                p, n, w = stats.get(action, (prior, 0, 0.))
+                stats[action] = (p, n + visits, w + visits * Q)
+        nodes = self.nodes
+        with nodes.lock:
+            if nodes.is_leaf(self.root):
+                nodes.expand(self.root, [(action, p) for action, (p, n, w) in stats.items()])
+            for action, child in nodes.children(self.root):
+                if action in stats:
+                    p, n, w = stats[action]
+                    visits = nodes.visits[child] + n
+                    if visits > 0:
+                        nodes.Q[child] = (nodes.Q[child] * nodes.visits[child] + w) / visits
+                    nodes.visits[child] = visits
+                    nodes.visits[self.root] += n
+
+    def ponder(self, board, player=2):
+        """
+        grow the tree from board with player to move in a background thread, while the opponent
+        thinks, until stop_pondering()
+        """
+        global time_end
+        self.stop_pondering()
+        time_end = time.time() + 3600   # no deadline, the opponent's move stops the search
+        rows = [list(row) for row in board]
+        stop = threading.Event()
+
+        def work():
+            position = Position(rows, player)
+            while not stop.is_set():
+                self.make_room()
+                self.playout(position)
+
+        self.ponder_stop = stop
+        self.ponder_thread = threading.Thread(target=work, daemon=True)
+        self.ponder_thread.start()
+
+    def stop_pondering(self):
+        # the running playout is finished and backpropagated before returning
+        if self.ponder_thread is not None:
+            self.ponder_stop.set()
+            self.ponder_thread.join()
+            self.ponder_thread = None
+
+    def close(self):
+        # stop the worker threads and processes
+        self.stop_pondering()
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+        if self.rollout_pool is not None:
+            self.rollout_pool.shutdown(wait=False, cancel_futures=True)
+            self.rollout_pool = None
+
+    def sync(self, board, player, last_move=None):
+        """
+        move the root to the position of board with player to move: the child reached by last_move, or
+        else the node of the position in the transposition table (after a takeback or a new board);
+        the tree is reset if neither exists. The root before last_move is kept until the next move,
+        so a takeback of one move goes back to it; a takeback of more moves resets the tree
+        """
+        symmetry = SymmetricHash(board)
+        h, frame = symmetry.canonical()
+        key = h ^ (symmetry.side if player == 2 else 0)
+        if key == self.root_key:
+            return
+        node = previous = None
+        if last_move is not None and self.root_key is not None:
+            # the child of the root by last_move, if the root is the position before it
+            x, y = last_move
+            symmetry.toggle(x, y, 3 - player)
+            h, frame = symmetry.canonical()
+            if h ^ (symmetry.side if player == 1 else 0) == self.root_key:
+                node = self.nodes.find_child(self.root, symmetry.to_canonical(last_move, frame))
+                if node is not None:
+                    previous = self.root
+        if node is None:
+            node = self.tt.get(key)
+        if node is None:
+            self.reset(key)
         else:
-            self.root = TreeNode(None, 1.0)
+            self.root = node
+            self.root_key = key
+            self.previous = previous
+            self.collect()
+
+    def collect(self):
+        # free the nodes which neither the root nor the root one ply back can reach any more
+        if self.previous is None and self.nodes.count[self.root] == 0:
+            self.reset(self.root_key, self.nodes.P[self.root])
+            return
+        ids = self.nodes.compact(self.root if self.previous is None else self.previous)
+        self.root = int(ids[self.root])
+        if self.previous is not None:
+            self.previous = int(ids[self.previous])
+        self.tt.remap(lambda node: int(ids[node]) if ids[node] >= 0 else None)
+
+    def set_max_memory(self, max_memory, size=None):
+        """
+        :param max_memory: the bytes the search may take, 0 for no limit: the arrays of the rollout
+            engines come first, then an eighth of the rest goes to the line cache and an eighth to the
+            table of the df-pn solver, and what is left to the nodes and the transposition table
+        :param size: the (height, width) of the board, to build its rollout engine before the budget
+        """
+        self.max_memory = max_memory
+        if size is not None and self.batch_rollouts:
+            rollout_engine(*size)
+        if max_memory > 0:
+            budget = max(0, max_memory - engine_bytes())
+            share = budget // 8
+            self.dfpn_tt_maxsize = min(self.dfpn_tt_size, max(1024, share // DfpnSolver.ENTRY_BYTES))
+            budget -= budget_line_cache(share) + self.dfpn_tt_maxsize * DfpnSolver.ENTRY_BYTES
+            max_nodes = max(1024, budget // (NodeStore.bytes_per_node() + self.tt.entry_bytes))
+            self.nodes.max_nodes = max_nodes
+            self.tt.resize(min(self.tt_size, max_nodes))
+        else:
+            budget_line_cache(0)
+            self.dfpn_tt_maxsize = self.dfpn_tt_size
+            self.nodes.max_nodes = None
+            self.tt.resize(self.tt_size)
+
+    def make_room(self, n=64):
+        # when the memory budget is nearly used up, free the subtrees below the least visited nodes
+        if not self.nodes.room(n):
+            self.previous = None    # its other subtrees go first
+            if self.nodes.prune(self.root):
+                self.collect()
+
+    def memory(self):
+        """
+        :return: the memory used by the nodes, the transposition table, the line cache, the table of
+            the last df-pn solver and the rollout engines, in bytes, and the budget
+        """
+        nodes, tt = self.nodes, self.tt
+        used = {"node_bytes": nodes.nbytes(),
+                "tt_bytes": tt.nbytes(),
+                "line_cache_bytes": line_cache.nbytes(),
+                "dfpn_bytes": self.dfpn_bytes,
+                "engine_bytes": engine_bytes()}
+        stats = {"nodes": len(nodes),
+                 "edges": nodes.edges,
+                 "max_nodes": nodes.max_nodes,
+                 "bytes": sum(used.values()),
+                 "max_memory": self.max_memory}
+        stats.update(used)
+        return stats
+
+    def reset(self, key=None, prior_P=1.0):
+        # forget the whole tree, the new root is the position of key if it is known
+        self.nodes.clear()
+        self.tt.clear()
+        self.root = self.nodes.new_node(prior_P)
+        self.root_key = key
+        self.previous = None
+        if key is not None:
+            self.tt.put(key, self.root)
 
     def print_Board(self, board):
         for i in range(20):
@@ -228,102 +586,112 @@ class RHMCTS(object):
 
 
 class RHMCTSPlayer(object):
-    def __init__(self, policy_evaluation_fn=policy_evaluation_function, c_puct=5, max_depth=1):
-        self.rhmcts = RHMCTS(policy_evaluation_fn, c_puct, max_depth)
+    def __init__(self, policy_evaluation_fn=policy_evaluation_function, c_puct=5, max_depth=None,
+                 tt_size=200000, tt_replacement="lru", workers=1, processes=1, rollout_workers=0, max_memory=0,
+                 batch_rollouts=True, dfpn_nodes=20000, dfpn_threats=6, dfpn_time=0.25):
+        self.rhmcts = RHMCTS(policy_evaluation_fn, c_puct, max_depth, tt_size, tt_replacement, workers,
+                             processes=processes, rollout_workers=rollout_workers, max_memory=max_memory,
+                             batch_rollouts=batch_rollouts, dfpn_nodes=dfpn_nodes, dfpn_threats=dfpn_threats,
+                             dfpn_time=dfpn_time)
 
     def get_action(self, board, time_limit):
+        """
+        :param time_limit: the time to move by, -1 to move at once, or a started TimeManager
+        """
         global time_end
-        time_end = time_limit if time_limit != -1 else -1
-        action = self.rhmcts.get_action(board)
+        timer = time_limit if isinstance(time_limit, TimeManager) else None
+        if timer is not None:
+            time_end = timer.deadline
+        else:
+            time_end = time_limit if time_limit != -1 else -1
+        action = self.rhmcts.get_action(board, timer)
         return action
 
-
-def get_action_fast_version(board):
-	# A simplified version to satisfy the time limit, do directed simulations by find_kill in limited depth.
-    time_limit = time.time() + 5
-    action = heuristic1(board, 1)
-    if action is not None:
-        return action
-    action = heuristic1(board, 2)
-    if action is not None:
-        return action
-    action = heuristic2(board, 1)
-    if action is not None:
-        return action
-    action = heuristic2_op(board, 2)
-    if action is not None:
-        return action
-    action = heuristic3(board, 1)
+    def ponder(self, board, player=2):
+        self.rhmcts.ponder(board, player)
+
+    def stop_pondering(self):
+        self.rhmcts.stop_pondering()
+
+    def tt_stats(self):
+        # lookups, hits, hit rate and size of the transposition table
+        return self.rhmcts.tt.stats()
+
+    def memory_stats(self):
+        # nodes and bytes used by the tree and the tables, and the budget
+        return self.rhmcts.memory()
+
+
+def _worker_init(size):
+    # the brain talks to the manager over stdout, which the workers must leave alone
+    sys.stdout = open(os.devnull, "w")
+    # build the line, pattern and Zobrist tables of the board size once for the process
+    board = [[0] * size for _ in range(size)]
+    board[size // 2][size // 2] = 1
+    policy_evaluation_function((board, 2), Position(board, 2).frontier)
+
+
+def _root_search(job):
+    # one root-parallel tree, run in a worker process
+    global time_end
+    board, time_end, policy_value_fn, c_puct, max_depth, workers, max_memory, seed = job
+    random.seed(seed)
+    rhmcts = RHMCTS(policy_value_fn, c_puct, max_depth, workers=workers)
+    rhmcts.set_max_memory(max_memory, (len(board), len(board[0])))
+    try:
+        rhmcts.search(board)
+    finally:
+        rhmcts.close()
+    nodes = rhmcts.nodes
+    return [(RHMCTS.root_move(board, action), float(nodes.P[child]), int(nodes.visits[child]), float(nodes.Q[child]))
+            for action, child in nodes.children(rhmcts.root)]
+
+
+_rollout_worker = dict()
+
+
+def _rollout(job):
+    # one leaf-parallel rollout, run in a worker process
+    global time_end
+    board, player, action, time_end, seed = job
+    random.seed(seed)
+    if _rollout_worker.get("board") != board:
+        # the rollouts of one expansion share the board, so its position is built once per process
+        _rollout_worker["board"] = board
+        _rollout_worker["position"] = Position(board, player)
+    if "rhmcts" not in _rollout_worker:
+        _rollout_worker["rhmcts"] = RHMCTS(policy_evaluation_function)
+    position = _rollout_worker["position"]
+    position.make(action)
+    try:
+        return _rollout_worker["rhmcts"].simulate(position)
+    finally:
+        position.unmake()
+
+
+def get_action_fast_version(board, time_limit=None):
+    # A simplified version to satisfy the time limit: a threat-space search for a forced win of either side,
+    # then the heuristics and the policy.
+    if time_limit is None:
+        time_limit = time.time() + 5
+    search = ThreatSpaceSearch(board)
+    line = search.solve(1, time.time() + (time_limit - time.time()) / 2)
+    if line is not None:
+        return line[0]
+    action = threat_action(board, 1)
     if action is not None:
         return action
-    action = heuristic3(board, 2)
-    if action is not None:
-        return action
-
-    moved = []
-    k = len(board)
-    for i in range(k):
-        for j in range(k):
-            if board[i][j] != 0:
-                moved.append((i, j))
-
-    adjacent = adjacent_2_moves(moved)
 
-    for x, y in adjacent:
-        board[x][y] = 1
-        if find_kill(board, 1, 2, time_limit) is True:
-            return x, y
-        board[x][y] = 0
+    # take the first move of a forced win of the opponent
+    line = search.solve(2, time_limit)
+    if line is not None:
+        return line[0]
 
-    for x, y in adjacent:
-        board[x][y] = 2
-        if find_kill(board, 2, 2, time_limit) is True:
-            return x, y
-        board[x][y] = 0
-
-    actions = policy_evaluation_function((board, 1))
+    position = Position(board, 1)
+    actions = policy_evaluation_function((position.board, 1), position.frontier)
     return max(actions, key=lambda x: x[1])[0]
 
 
-def find_kill(board, player, depth, time_limit):
-    if depth <= 0:
-        return False
-    if time.time() > time_limit:
-        return False
-
-    op = 3 - player
-    action = heuristic1(board, player)
-    if action is None:
-        action = heuristic2_op(board, player)
-    if action is None:
-        return False
-
-    if action is not None:
-        x0, y0 = action
-        board[x0][y0] = op
-        if heuristic1(board, player) is not None:
-            return True
-        if heuristic2(board, player) is not None:
-            return True
-
-        moved = []
-        k = len(board)
-        for i in range(k):
-            for j in range(k):
-                if board[i][j] != 0:
-                    moved.append((i, j))
-        adjacent = adjacent_2_moves(moved)
-        for x, y in adjacent:
-            if time.time() > time_limit:
-                return False
-            board[x][y] = player
-            if find_kill(board, player, depth-1, time_limit) is True:
-                return True
-            board[x][y] = 0
-        board[x0][y0] = 0
-    return False
-
-
 # test
 if __name__ == "__main__":
     test_board = [[0 for i in range(20)] for j in range(20)]
@@ -360,7 +728,7 @@ if __name__ == "__main__":
     #         break
     #     test_board[x][y] = 1
     #     player1.rhmcts.print_Board(test_board)
-    #     player1.rhmcts.update_with_move((x, y))
+    #     player1.rhmcts.sync(test_board, 2, (x, y))
     #
     #     move = input('your move:')
     #     x, y = move.strip().split(',')
@@ -0,0 +1,284 @@
+"""
+Iterative-deepening alpha-beta search.
+
+A negamax search with principal variation search (PVS): the first move of a node is searched
+with the full window, and the others with a null window which only proves them worse, being
+searched again when one turns out better. The search deepens one ply at a time until the
+deadline, and the moves are ordered by
+
+    the move of the transposition table, from the last iteration or a transposition (the table
+    is keyed by the canonical hash, so also a rotation or reflection of the position)
+    the killer moves of the ply, which made a cutoff in a sibling
+    the history heuristic, the cutoffs a move made anywhere weighted by depth
+    the pattern score of the move: batch_move_scores at the root, and the window weights of the
+    rollout board, which are kept up to date by make/unmake, below it
+
+Only the `width` best moves by pattern score are searched at a node. Fives end the search: the
+side to move wins with one, and has to block a single five of the opponent (without counting
+the ply), and loses against two. The leaves are scored by BoardEvaluator, but for a leaf where
+the side to move makes an open four. Before the search, a forced win found by the threat-space
+search is played at once.
+"""
+import time
+from batch import batch_move_scores
+from position import Position
+from threatspace import ThreatSpaceSearch
+from utils import BoardEvaluator, line_cache, budget_line_cache
+from zobrist import TranspositionTable
+
+
+WIN = 10 ** 9
+# a score above WON is a win in WIN - score plies, and one below -WON a loss
+WON = WIN - 10 ** 4
+# the bounds stored in the transposition table
+EXACT, LOWER, UPPER = 0, 1, 2
+
+
+class AlphaBeta(object):
+    """
+    Alpha-beta search of the best move, kept from move to move for its tables.
+    """
+    ENTRY_BYTES = 256   # about the memory of one entry of the table, with its bound and move
+
+    def __init__(self, width=10, tt_size=200000, max_depth=20, threat_time=0.25, threat_tt_size=100000,
+                 max_memory=0):
+        """
+        :param width: the number of moves searched at a node, the best by pattern score
+        :param tt_size: the number of positions kept in the transposition table
+        :param max_depth: the deepest iteration
+        :param threat_time: the share of the time the threat-space search may take
+        :param threat_tt_size: the number of positions kept in the table of the threat-space search
+        :param max_memory: the bytes the search may take, 0 for no limit, see set_max_memory
+        """
+        self.width = width
+        self.threat_time = threat_time
+        self.max_depth = max_depth
+        self.tt_size = tt_size
+        self.tt = TranspositionTable(tt_size, entry_bytes=self.ENTRY_BYTES)
+        self.threat_tt_size = threat_tt_size
+        self.threat_tt_maxsize = threat_tt_size     # within the memory budget
+        self.threat_bytes = 0   # the table of the last threat-space search
+        self.max_memory = 0
+        self.set_max_memory(max_memory)
+        self.killers = []
+        self.history = dict()
+        self.position = None
+        self.evaluator = None
+        self.deadline = None
+        self.timeout = False
+        self.nodes = 0
+        self.depth = 0  # the depth of the last completed iteration
+
+    def get_action(self, board, deadline, player=1):
+        """
+        :param deadline: the time to move by
+        :return: the best move of the deepest iteration completed by the deadline
+        """
+        self.position = Position(board, player)
+        self.evaluator = BoardEvaluator(self.position.board)
+        self.deadline = deadline
+        self.timeout = False
+        self.nodes = 0
+        self.killers = [[None, None] for _ in range(self.max_depth + 1)]
+        # the history of the last move still orders the moves, with half the weight
+        self.history = {move: h // 2 for move, h in self.history.items()}
+
+        moves = self.candidates()
+        if not moves:
+            return len(board) // 2, len(board[0]) // 2
+        search = ThreatSpaceSearch(board, self.threat_tt_maxsize)
+        line = search.solve(player, time.time() + (deadline - time.time()) * self.threat_time)
+        self.threat_bytes = search.tt.nbytes()
+        if line is not None:
+            return line[0]
+        best = moves[0]
+        for depth in range(1, self.max_depth + 1):
+            score, move = self.root(depth)
+            if self.timeout:
+                break
+            best, self.depth = move, depth
+            if abs(score) >= WON:
+                break   # a forced result
+        return best
+
+    def set_max_memory(self, max_memory):
+        """
+        :param max_memory: the bytes the search may take, 0 for no limit: an eighth goes to the line
+            cache and an eighth to the table of the threat-space search, the rest to the transposition
+            table
+        """
+        self.max_memory = max_memory
+        if max_memory > 0:
+            share = max_memory // 8
+            self.threat_tt_maxsize = min(self.threat_tt_size, max(1024, share // ThreatSpaceSearch.ENTRY_BYTES))
+            budget = max_memory - budget_line_cache(share) - self.threat_tt_maxsize * ThreatSpaceSearch.ENTRY_BYTES
+            self.tt.resize(min(self.tt_size, max(1024, budget // self.ENTRY_BYTES)))
+        else:
+            budget_line_cache(0)
+            self.threat_tt_maxsize = self.threat_tt_size
+            self.tt.resize(self.tt_size)
+
+    def memory(self):
+        """
+        :return: the memory used by the transposition table, the line cache and the table of the last
+            threat-space search, in bytes, and the budget
+        """
+        used = {"tt_bytes": self.tt.nbytes(),
+                "line_cache_bytes": line_cache.nbytes(),
+                "threat_bytes": self.threat_bytes}
+        stats = {"bytes": sum(used.values()), "max_memory": self.max_memory}
+        stats.update(used)
+        return stats
+
+    def candidates(self, ply=0, tt_move=None):
+        """
+        the moves of the side to move, in search order
+        """
+        position = self.position
+        board, player, threats = position.board, position.player, position.threats
+        opponent = 3 - player
+        if threats.fives[player]:
+            return [threats.five(player)]
+        if threats.fives[opponent]:
+            return [threats.five(opponent)]
+        moves = [(x, y) for x, y in position.frontier.candidates(2) if board[x][y] == 0]
+        if not moves:
+            return []
+        if ply == 0:
+            sign = 1 if player == 1 else -1     # the scores are for player 1
+            scores = dict(zip(moves, (sign * score for score in batch_move_scores(board, moves, player))))
+        else:
+            weight, width = position.rollout.weight, len(board[0])
+            scores = {(x, y): weight[x * width + y] for x, y in moves}
+        moves = sorted(moves, key=lambda m: -scores[m])[:self.width]
+        killers = self.killers[ply] if ply < len(self.killers) else ()
+        first = [m for m in [tt_move] + list(killers) if m in scores]
+        rest = sorted((m for m in moves if m not in first), key=lambda m: -self.history.get(m, 0))
+        return list(dict.fromkeys(first + rest))
+
+    def root(self, depth):
+        # one iteration at the root: (score, best move)
+        alpha, beta = -WIN, WIN
+        key, frame = self.position.canonical_key()
+        entry = self.tt.get(key)
+        best = None
+        for k, move in enumerate(self.candidates(0, self._tt_move(entry, frame))):
+            score = self.search_move(move, depth, alpha, beta, 0, k == 0)
+            if self.timeout:
+                break
+            if best is None or score > alpha:
+                alpha, best = max(alpha, score), move
+        if not self.timeout:
+            self.tt.put(key, (depth, alpha, EXACT, self.position.symmetry.to_canonical(best, frame)))
+        return alpha, best
+
+    def _tt_move(self, entry, frame):
+        # the best move of an entry, which is kept as a move of the canonical board
+        if entry is None or entry[3] is None:
+            return None
+        return self.position.symmetry.from_canonical(entry[3], frame)
+
+    def search_move(self, move, depth, alpha, beta, ply, first):
+        # the score of move for the side to move, with a null window unless it is the first move
+        position = self.position
+        player = position.player
+        threats = position.threats
+        if move[0] * threats.width + move[1] in threats.fives[player]:
+            return WIN - ply - 1
+        forced = bool(threats.fives[3 - player])    # a block is not counted
+        next_depth = depth if forced else depth - 1
+        self._make(move)
+        try:
+            if first:
+                return -self.pvs(next_depth, -beta, -alpha, ply + 1)
+            score = -self.pvs(next_depth, -alpha - 1, -alpha, ply + 1)
+            if alpha < score < beta and not self.timeout:
+                score = -self.pvs(next_depth, -beta, -alpha, ply + 1)
+            return score
+        finally:
+            self._unmake()
+
+    def pvs(self, depth, alpha, beta, ply):
+        """
+        negamax with principal variation search
+        :return: the score of the side to move, within (alpha, beta) unless it is a bound
+        """
+        position = self.position
+        player = position.player
+        threats = position.threats
+        if threats.fives[player]:
+            return WIN - ply - 1
+        if len(threats.fives[3 - player]) > 1:
+            return -(WIN - ply - 2)
+        self.nodes += 1
+        if self.nodes & 255 == 0 and time.time() > self.deadline:
+            self.timeout = True
+        if self.timeout:
+            return 0
+        if depth <= 0 and not threats.fives[3 - player]:
+            if threats.open_fours[player]:
+                return WIN - ply - 3    # an open four, the opponent blocks one end
+            score = self.evaluator.score
+            return score if player == 1 else -score
+
+        key, frame = position.canonical_key()
+        entry = self.tt.get(key)
+        tt_move = self._tt_move(entry, frame)
+        if entry is not None:
+            tt_depth, score, bound, _ = entry
+            score = _from_tt(score, ply)
+            if tt_depth >= depth:
+                if bound == EXACT or (bound == LOWER and score >= beta) or (bound == UPPER and score <= alpha):
+                    return score
+
+        moves = self.candidates(ply, tt_move)
+        if not moves:
+            return 0    # a full board
+        original_alpha = alpha
+        best, best_move = -WIN, None
+        for k, move in enumerate(moves):
+            score = self.search_move(move, depth, alpha, beta, ply, k == 0)
+            if self.timeout:
+                return 0
+            if score > best:
+                best, best_move = score, move
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                self._cutoff(move, depth, ply)
+                break
+        bound = UPPER if best <= original_alpha else LOWER if best >= beta else EXACT
+        self.tt.put(key, (depth, _to_tt(best, ply), bound, position.symmetry.to_canonical(best_move, frame)))
+        return best
+
+    def _cutoff(self, move, depth, ply):
+        # a move refuting the move before it: a killer of the ply, and its history grows
+        if ply < len(self.killers) and self.killers[ply][0] != move:
+            self.killers[ply] = [move, self.killers[ply][0]]
+        self.history[move] = self.history.get(move, 0) + depth * depth
+
+    def _make(self, move):
+        self.position.make(move)
+        self.evaluator.update(*move)
+
+    def _unmake(self):
+        move = self.position.unmake()
+        self.evaluator.update(*move)
+
+
+def _to_tt(score, ply):
+    # the table keeps the distance of a win from the node, as the node may be reached at another ply
+    if score >= WON:
+        return score + ply
+    if score <= -WON:
+        return score - ply
+    return score
+
+
+def _from_tt(score, ply):
+    # a score of the table as the distance from the root, the node being at ply
+    if score >= WON:
+        return score - ply
+    if score <= -WON:
+        return score + ply
+    return score
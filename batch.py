@@ -0,0 +1,139 @@
+"""
+Vectorized scoring of all candidate moves of a board at once.
+
+A move only changes the 4 lines through its cell (see BoardEvaluator), so the lines through
+every candidate are gathered with the stone placed into one stacked tensor of shape
+(candidates, 4 lines, 2 colors, line length). The base 5 codes of all windows are computed
+with a convolution over the last axis, and the pattern tables of utils.PatternMatcher are
+looked up for all windows in one go.
+"""
+import numpy as np
+from utils import *
+
+
+EDGE = PatternMatcher.EDGE
+WINDOW = PatternMatcher.WINDOW
+# cell values seen from player 2, as black_color does; the edges of the lines stay edges
+_BLACK_COLOR = np.array([0, 2, 1, 0, EDGE], dtype=np.int64)
+_POWERS = (EDGE + 1) ** np.arange(WINDOW - 1, -1, -1, dtype=np.int64)
+
+_line_index = dict()
+_pattern_tables = dict()
+
+
+def _overlaps_itself(symbols):
+    return any(symbols[d:] == symbols[:len(symbols) - d] for d in range(1, len(symbols)))
+
+
+def pattern_tables(matcher):
+    """
+    tables indexed by the code of a window, built once per matcher
+    :return:
+        free_score: the total score of the patterns starting at the window which can not overlap
+                    themselves, so that every occurrence counts
+        overlap_hits: a bool array (code, q) telling whether the q-th self-overlapping pattern
+                      starts at the window
+        overlap_lengths, overlap_scores: the lengths and scores of the self-overlapping patterns
+    """
+    key = id(matcher)
+    if key not in _pattern_tables:
+        score_map = class_to_score()
+        overlapping = [pid for pid, symbols in enumerate(matcher.symbols) if _overlaps_itself(symbols)]
+        column = {pid: q for q, pid in enumerate(overlapping)}
+        free_score = np.zeros(matcher.size, dtype=np.int64)
+        overlap_hits = np.zeros((matcher.size, len(overlapping)), dtype=bool)
+        for code, pids in enumerate(matcher.table):
+            for pid in pids:
+                if pid in column:
+                    overlap_hits[code, column[pid]] = True
+                else:
+                    free_score[code] += score_map[matcher.classes[pid]]
+        overlap_lengths = np.array([matcher.lengths[pid] for pid in overlapping], dtype=np.int64)
+        overlap_scores = np.array([score_map[matcher.classes[pid]] for pid in overlapping], dtype=np.int64)
+        _pattern_tables[key] = (free_score, overlap_hits, overlap_lengths, overlap_scores)
+    return _pattern_tables[key]
+
+
+def line_index(size):
+    """
+    the lines of board_lines(size) as indices into a flat array of cell values, which holds the
+    size * size cells of the board followed by the edge of extend_board (3) and the end of a line
+    :return:
+        index: an int array (lines, 1 + longest line + WINDOW), each line starting with one end
+               and padded with ends after its last cell
+        lines_of: an int array (size * size, 4) of the lines through every cell
+    """
+    if size not in _line_index:
+        lines, lines_of = board_lines(size)
+        border, end = size * size, size * size + 1
+        width = 1 + max(len(line) for line in lines) + WINDOW
+        index = np.full((len(lines), width), end, dtype=np.int64)
+        for idx, line in enumerate(lines):
+            index[idx, 1:len(line) + 1] = [border if cell is None else cell[0] * size + cell[1] for cell in line]
+        through = np.zeros((size * size, 4), dtype=np.int64)
+        for (x, y), line_ids in lines_of.items():
+            through[x * size + y] = line_ids
+        _line_index[size] = (index, through)
+    return _line_index[size]
+
+
+def line_scores(values, reference=False):
+    """
+    :param values: an int array (..., 1 + line length + WINDOW) of lines laid out as in line_index
+    :return: an int array (...) of the scores of the lines, the same as line_classes gives
+    """
+    free_score, overlap_hits, overlap_lengths, overlap_scores = pattern_tables(
+        reference_matcher if reference else pattern_matcher)
+    shape = values.shape[:-1]
+    values = values.reshape(-1, values.shape[-1])
+    starts = values.shape[1] - WINDOW + 1
+    # codes of all windows, as a convolution of the lines with the powers of 5
+    codes = np.zeros((values.shape[0], starts), dtype=np.int64)
+    for k in range(WINDOW):
+        codes += values[:, k:k + starts] * _POWERS[k]
+    scores = free_score[codes].sum(axis=1)
+    if len(overlap_lengths):
+        # patterns which may overlap themselves are counted from left to right without overlapping
+        hits = overlap_hits[codes]
+        next_start = np.zeros((values.shape[0], len(overlap_lengths)), dtype=np.int64)
+        counts = np.zeros_like(next_start)
+        for i in range(starts):
+            taken = hits[:, i] & (next_start <= i)
+            counts += taken
+            next_start = np.where(taken, i + overlap_lengths, next_start)
+        scores += counts @ overlap_scores
+    return scores.reshape(shape)
+
+
+def batch_move_scores(board, moves, player, reference=False):
+    """
+    score all candidate moves in one call
+    :param board: a 2-d list (or BitBoard) of size x size
+    :param moves: a list of empty coordinates (x, y)
+    :param player: the player to place the stone
+    :param reference: only count the patterns of class_dict, as the regex scan always did
+    :return: a list of board_evaluation(board, player) for the board after each move
+    """
+    if len(moves) == 0:
+        return []
+    size = len(board)
+    index, through = line_index(size)
+    flat = np.empty(size * size + 2, dtype=np.int64)
+    flat[:size * size] = np.asarray(board, dtype=np.int64).reshape(-1)
+    flat[size * size] = 3
+    flat[size * size + 1] = EDGE
+
+    # score of every line of the board, for both colors
+    board_values = flat[index]
+    base = line_scores(np.stack([board_values, _BLACK_COLOR[board_values]]), reference)
+    base = base[0] - base[1]
+
+    # the 4 lines through every candidate with its stone placed
+    cells = np.array([x * size + y for x, y in moves], dtype=np.int64)
+    lines = through[cells]                          # (candidates, 4)
+    cand_index = index[lines]                       # (candidates, 4, width)
+    values = flat[cand_index]
+    values[cand_index == cells[:, None, None]] = player
+    scores = line_scores(np.stack([values, _BLACK_COLOR[values]], axis=2), reference)
+    delta = (scores[:, :, 0] - scores[:, :, 1] - base[lines]).sum(axis=1)
+    return (base.sum() + delta).tolist()
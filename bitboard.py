@@ -0,0 +1,157 @@
+"""
+Bitboard backend of the gomoku board.
+
+Cell (x, y) of a board with `width` columns is stored at bit x * (width + 1) + y of one
+big integer per cell value (0: empty, 1: black, 2: white, 3: blocked). The extra column
+at y = width is always empty, so a line never wraps around the edge of the board and a
+whole board can be moved one cell along any direction with a single shift:
+
+    column (x+1, y): width + 1      row (x, y+1): 1
+    positive diagonal (x+1, y+1): width + 2      oblique diagonal (x+1, y-1): width
+
+A window of k cells along a direction is identified by the bit of its first cell, and the
+lowest bit of a mask of windows is the first window met when scanning the board row by row.
+"""
+
+
+class _Row(list):
+    """
+    A row of a BitBoard. It behaves like a plain list, but every write of a cell is also
+    recorded in the bit masks of its board.
+    """
+    def __init__(self, board, x, cells):
+        super(_Row, self).__init__(cells)
+        self.board = board
+        self.offset = x * board.stride
+
+    def __setitem__(self, y, value):
+        old = list.__getitem__(self, y)
+        list.__setitem__(self, y, value)
+        if old != value:
+            bit = 1 << (self.offset + y)
+            masks = self.board.masks
+            masks[old] ^= bit
+            masks[value] |= bit
+
+
+class BitBoard(list):
+    """
+    A 2-d board which keeps one bit mask per cell value next to the usual list of rows.
+    board[x][y] can be read and written exactly as for a list of lists, so it can be handed
+    to any function expecting one, while the heuristics and the terminal check work on
+    the masks.
+    """
+    def __init__(self, board):
+        self.width = len(board[0]) if len(board) > 0 else 0
+        self.stride = self.width + 1
+        self.masks = list(bit_masks(board)[0])
+        super(BitBoard, self).__init__(_Row(self, x, row) for x, row in enumerate(board))
+
+    def __deepcopy__(self, memo):
+        return BitBoard(self)
+
+    def copy(self):
+        return BitBoard(self)
+
+    def bit(self, x, y):
+        return x * self.stride + y
+
+    def cell(self, bit):
+        return divmod(bit, self.stride)
+
+    def has_five(self, x, y, player):
+        """whether the stones of player form five in a line through (x, y)"""
+        return has_five(self.masks[player], self.stride, x * self.stride + y)
+
+    def is_full(self):
+        return self.masks[0] == 0
+
+
+# translation tables turning a row string into the binary string of one cell value
+_ONE_HOT = [{ord(c): "1" if int(c) == v else "0" for c in "0123"} for v in range(4)]
+
+
+def bit_masks(board):
+    """
+    :param board: a BitBoard or a 2-d list
+    :return: ([mask of empty cells, mask of player 1, mask of player 2, mask of blocks], stride)
+    """
+    if isinstance(board, BitBoard):
+        return board.masks, board.stride
+    width = len(board[0]) if len(board) > 0 else 0
+    stride = width + 1
+    masks = [0, 0, 0, 0]
+    for x, row in enumerate(board):
+        # read the row backwards so that y = 0 ends up in the lowest bit
+        line = "".join(map(str, reversed(row)))
+        offset = x * stride
+        for v in range(4):
+            masks[v] |= int(line.translate(_ONE_HOT[v]), 2) << offset
+    return masks, stride
+
+
+def direction_shifts(stride):
+    """shifts of the column, row, positive diagonal and oblique diagonal directions"""
+    return stride, 1, stride + 1, stride - 1
+
+
+def match(masks, shift, pattern):
+    """
+    :param masks: bit masks indexed by cell value
+    :param shift: the direction to read the windows along
+    :param pattern: a tuple of cell values
+    :return: the mask of the first cells of all windows reading pattern along the direction
+    """
+    windows = -1
+    for k, value in enumerate(pattern):
+        windows &= masks[value] >> (k * shift)
+    return windows
+
+
+def spread(windows, shift, offsets):
+    """the mask of the cells at the given offsets of every window in windows"""
+    cells = 0
+    for k in offsets:
+        cells |= windows << (k * shift)
+    return cells
+
+
+def lowest_bit(mask):
+    return (mask & -mask).bit_length() - 1
+
+
+def iter_bits(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def has_five(stones, stride, bit):
+    """whether stones contains five in a line through the given bit"""
+    for shift in direction_shifts(stride):
+        fives = stones & (stones >> shift)
+        fives &= fives >> (2 * shift)
+        fives &= stones >> (4 * shift)
+        for k in range(5):
+            start = bit - k * shift
+            if start >= 0 and fives >> start & 1:
+                return True
+    return False
+
+
+def gap_patterns(length, player, stones, padded=False):
+    """
+    All windows of `length` cells holding `stones` stones of player and empty cells elsewhere.
+    If padded, the first and last cells are always empty and the stones are in between.
+    :return: a list of (pattern, offsets of the empty cells in between)
+    """
+    inner = range(1, length - 1) if padded else range(length)
+    patterns = []
+    for mask in range(1 << len(inner)):
+        chosen = [k for i, k in enumerate(inner) if mask >> i & 1]
+        if len(chosen) != stones:
+            continue
+        pattern = tuple(player if k in chosen else 0 for k in range(length))
+        patterns.append((pattern, tuple(k for k in inner if k not in chosen)))
+    return patterns
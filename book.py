@@ -0,0 +1,208 @@
+"""
+Opening book in a binary file.
+
+The file is a header, with the version of the format, followed by fixed-size records (key, x,
+y, score, visits), sorted by key. The key of a position is the canonical hash (see
+SymmetricHash) of its board with the colors swapped when player 2 is to move, so that the side
+to move always has the stones of player 1: a position is found whichever player started the
+game, and whichever rotation or reflection of it was stored. The moves of the records are moves
+of the canonical board. The book is read through mmap and searched by bisection, so opening it
+reads nothing but the header and a lookup touches a few pages of the file.
+
+BookBuilder collects moves from self-play games or from search results (the root children of
+RHMCTS.merge_root), and writes the most visited move of every position.
+
+    python book.py [--size 15] book.bin games.txt ...
+
+builds a book for the board size (20 by default, or "HEIGHTxWIDTH") from game records, one game
+per line as moves "x,y" separated by spaces, the first move being player 1's, and the player of
+the last move winning if it completes five.
+"""
+import os
+import argparse
+import mmap
+import struct
+from zobrist import SymmetricHash
+
+
+MAGIC = b"RHBK"
+# 2: the keys are canonical hashes and the moves are moves of the canonical board
+VERSION = 2
+HEADER = struct.Struct("<4sHHHI")     # magic, version, height, width, number of records
+RECORD = struct.Struct("<QHHfI")      # key, x, y, score, visits
+KEY = struct.Struct("<Q")
+
+
+def book_key(board, player):
+    """
+    :return: the key of board with player to move, and the SymmetricHash and symmetry t mapping
+        the moves of board to the moves of the records
+    """
+    if player == 2:
+        board = [[3 - v if v in (1, 2) else v for v in row] for row in board]
+    symmetry = SymmetricHash(board)
+    h, t = symmetry.canonical()
+    return h, symmetry, t
+
+
+class OpeningBook(object):
+    """
+    A book file opened read-only through mmap.
+    """
+    def __init__(self, path, min_visits=1):
+        """
+        :param min_visits: the fewest visits of a record for its move to be played
+        """
+        self.min_visits = min_visits
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) < HEADER.size or self.map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError("not an opening book: {}".format(path))
+        _, version, self.height, self.width, self.size = HEADER.unpack_from(self.map, 0)
+        if version != VERSION:
+            self.close()
+            raise ValueError("opening book {} has version {}, not {}: build it again".format(path, version, VERSION))
+        if len(self.map) != HEADER.size + self.size * RECORD.size:
+            self.close()
+            raise ValueError("not an opening book: {}".format(path))
+
+    def _key(self, i):
+        return KEY.unpack_from(self.map, HEADER.size + i * RECORD.size)[0]
+
+    def probe(self, board, player=1):
+        """
+        :return: (move, score, visits) of the position, or None if it is not in the book
+        """
+        if (len(board), len(board[0])) != (self.height, self.width):
+            return None
+        key, symmetry, t = book_key(board, player)
+        lo, hi = 0, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == self.size or self._key(lo) != key:
+            return None
+        _, x, y, score, visits = RECORD.unpack_from(self.map, HEADER.size + lo * RECORD.size)
+        return symmetry.from_canonical((x, y), t), score, visits
+
+    def move(self, board, player=1):
+        """
+        :return: the book move of the position, or None if it has none with enough visits
+        """
+        record = self.probe(board, player)
+        if record is None or record[2] < self.min_visits:
+            return None
+        x, y = record[0]
+        return (x, y) if board[x][y] == 0 else None
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def __len__(self):
+        return self.size
+
+
+class BookBuilder(object):
+    """
+    The statistics of the moves of the positions to put in a book.
+    """
+    def __init__(self, height=20, width=20, max_ply=12):
+        """
+        :param max_ply: the most stones on the board of a position kept from a game
+        """
+        self.height = height
+        self.width = width
+        self.max_ply = max_ply
+        self.moves = dict()     # key -> {move: [visits, sum of the scores]}
+
+    def add(self, board, player, move, score, visits=1):
+        """
+        :param score: the value of move for player, in [-1, 1], as the mean over visits
+        """
+        key, symmetry, t = book_key(board, player)
+        stats = self.moves.setdefault(key, dict()).setdefault(symmetry.to_canonical(move, t), [0, 0.])
+        stats[0] += visits
+        stats[1] += score * visits
+
+    def add_analysis(self, board, player, children):
+        """
+        :param children: a list of (action, prior, visits, Q) of the root, as root_parallel gives
+        """
+        for action, _, visits, Q in children:
+            if visits > 0:
+                self.add(board, player, action, Q, visits)
+
+    def add_game(self, moves, winner):
+        """
+        :param moves: the moves of a game, player 1 first
+        :param winner: 0 for a tie, 1 or 2
+        """
+        board = [[0] * self.width for _ in range(self.height)]
+        player = 1
+        for x, y in moves[:self.max_ply]:
+            score = 0. if winner == 0 else 1. if winner == player else -1.
+            self.add(board, player, (x, y), score)
+            board[x][y] = player
+            player = 3 - player
+
+    def write(self, path):
+        """
+        write the most visited move of every position, sorted by key
+        """
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, self.height, self.width, len(self.moves)))
+            for key in sorted(self.moves):
+                move, (visits, total) = max(self.moves[key].items(), key=lambda item: (item[1][0], item[1][1]))
+                f.write(RECORD.pack(key, move[0], move[1], total / visits, visits))
+
+    def __len__(self):
+        return len(self.moves)
+
+
+def _winner(moves, height, width):
+    # the player of the last move if it completes five, else 0
+    board = [[0] * width for _ in range(height)]
+    for ply, (x, y) in enumerate(moves):
+        board[x][y] = ply % 2 + 1
+    x, y = moves[-1]
+    player = board[x][y]
+    for dx, dy in ((1, 0), (0, 1), (1, 1), (1, -1)):
+        n = 1
+        for sign in (1, -1):
+            i, j = x + sign * dx, y + sign * dy
+            while 0 <= i < height and 0 <= j < width and board[i][j] == player:
+                n += 1
+                i, j = i + sign * dx, j + sign * dy
+        if n >= 5:
+            return player
+    return 0
+
+
+def _size(text):
+    # "15" or "15x20", as (height, width)
+    height, _, width = text.partition("x")
+    return int(height), int(width or height)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="build an opening book from game records")
+    parser.add_argument("--size", type=_size, default=(20, 20), help='the board size, "15" or "15x20"')
+    parser.add_argument("book")
+    parser.add_argument("games", nargs="+")
+    args = parser.parse_args()
+    builder = BookBuilder(*args.size)
+    for name in args.games:
+        with open(name) as f:
+            for number, line in enumerate(f, 1):
+                moves = [tuple(int(v) for v in move.split(",")) for move in line.split()]
+                if any(not (0 <= x < builder.height and 0 <= y < builder.width) for x, y in moves):
+                    parser.error("{}:{}: a move off the {}x{} board".format(name, number, builder.height, builder.width))
+                if moves:
+                    builder.add_game(moves, _winner(moves, builder.height, builder.width))
+    builder.write(args.book)
+    print("{} positions written to {} ({} bytes)".format(len(builder), args.book, os.path.getsize(args.book)))
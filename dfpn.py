@@ -0,0 +1,222 @@
+"""
+Depth-first proof-number search (df-pn) of threat sequences.
+
+The tree is the AND/OR tree of ThreatSpaceSearch: at OR nodes the attacker plays a four or an
+open three, at AND nodes the defender answers it. Every node has a proof number pn, the fewest
+leaves to prove for the attacker to win, and a disproof number dn, the fewest to show the
+attacker does not win (0 and INF for a proven node, INF and 0 for a disproven one):
+
+    OR node:  pn = min of the children,  dn = sum of the children
+    AND node: pn = sum of the children,  dn = min of the children
+
+df-pn goes down to the most proving node as proof-number search does, but depth first: a child
+is searched until its numbers cross the thresholds passed down by its parent, which is when a
+sibling has become more promising. The numbers are kept in a bounded transposition table, whose
+replacement keeps the entries which took the most work, and a node budget and a deadline bound
+the search. The table is keyed by the canonical hash, so the rotations and reflections of a
+position share their numbers.
+"""
+import time
+from threatspace import ThreatSpaceSearch, FOUR_BITS
+from utils import Frontier
+from zobrist import TranspositionTable
+
+
+INF = 1 << 30
+
+
+class DfpnSolver(ThreatSpaceSearch):
+    """
+    df-pn on one board, which is made and unmade in place; the attacker is the player to move.
+    """
+    ENTRY_BYTES = 288   # about the memory of one entry of the table, with its key and numbers
+
+    def __init__(self, board, tt_size=100000, vct=True):
+        """
+        :param tt_size: the number of nodes kept in the transposition table
+        :param vct: whether the attacker plays open threes, or only fours
+        """
+        ThreatSpaceSearch.__init__(self, board, tt_size)
+        self.tt = TranspositionTable(tt_size, "visits", visits=lambda entry: entry[2],
+                                     entry_bytes=self.ENTRY_BYTES)
+        self.vct = vct
+        self.max_nodes = 0
+
+    def threat_count(self):
+        """
+        the number of cells making a four or an open three for either player
+        """
+        return len(self.index.threat_cells[1]) + len(self.index.threat_cells[2])
+
+    def prove(self, player, deadline, max_nodes=20000):
+        """
+        :param player: the attacker, who is to move
+        :param deadline: the time to give up by
+        :param max_nodes: the most nodes to search
+        :return: (result, line), where result is True for a proven win of player, False for a
+            disproven one and None if the budget ran out; line is the winning line of a proven win,
+            following the first defence at every AND node
+        """
+        self.deadline = deadline
+        self.timeout = False
+        self.nodes = 0
+        self.max_nodes = max_nodes
+        self._mid(player, True, INF, INF)
+        pn, dn, _ = self._lookup((self.symmetry.canonical()[0], player, True))
+        if pn == 0:
+            return True, [self.index.cell(c) for c in self._line(player)]
+        return (False, None) if dn == 0 else (None, None)
+
+    def refutations(self, player, line, deadline, max_nodes=20000):
+        """
+        :param line: the proven winning line of the opponent, were the opponent to move
+        :return: the moves of player which are not proven to lose against the threats of the opponent,
+            out of every cell next to the stones (as Frontier finds them): the defences at the AND
+            nodes of the line and the fours of player are searched first, and the moves left when the
+            deadline passes are not proven to lose
+        """
+        opponent = 3 - player
+        width = self.index.width
+        first = self._line_defences(opponent, [width * x + y for x, y in line])
+        first.update(self._threats(player, FOUR_BITS))
+        board = [self.index.cells[x * width:(x + 1) * width] for x in range(self.index.height)]
+        near = {width * x + y for x, y in Frontier(board).candidates(2)}
+        moves = sorted(c for c in first if self.index.cells[c] == 0) + sorted(near.difference(first))
+        refutations = []
+        for c in moves:
+            if time.time() > deadline:
+                refutations.append(self.index.cell(c))
+                continue
+            self._make(c, player)
+            try:
+                proven, _ = self.prove(opponent, deadline, max_nodes)
+            finally:
+                self._unmake(c, player)
+            if not proven:
+                refutations.append(self.index.cell(c))
+        return refutations
+
+    def _line_defences(self, attacker, line):
+        # the cells of line, and every defence of the AND nodes along it: the blocks of the fives, and
+        # the defences and window cells of the open threes
+        index = self.index
+        defences = set(line)
+        made = []
+        try:
+            for k, c in enumerate(line):
+                if k % 2 == 1:
+                    if index.fives[attacker]:
+                        defences.update(index.fives[attacker])
+                    elif index.open_fours[attacker]:
+                        replies, cells = self._defences(attacker)
+                        defences.update(replies)
+                        defences.update(cells)
+                if index.cells[c] != 0:
+                    break
+                player = attacker if k % 2 == 0 else 3 - attacker
+                self._make(c, player)
+                made.append((c, player))
+        finally:
+            for c, player in reversed(made):
+                self._unmake(c, player)
+        return defences
+
+    def _lookup(self, key):
+        entry = self.tt.get(key)
+        return entry if entry is not None else (1, 1, 0)
+
+    def _child_key(self, c, player, attacker, is_or):
+        x, y = self.index.cell(c)
+        return self.symmetry.child(x, y, player)[0], attacker, is_or
+
+    def _expand(self, attacker, is_or):
+        # the moves of a node, or None and its numbers when it is decided at once
+        index = self.index
+        defender = 3 - attacker
+        if is_or:
+            if index.fives[attacker]:
+                return None, (0, INF)
+            moves = self._attacks(attacker, self.vct)
+            return (moves, None) if moves else (None, (INF, 0))
+        if index.fives[defender]:
+            return None, (INF, 0)
+        fives = index.fives[attacker]
+        if len(fives) > 1:
+            return None, (0, INF)
+        if fives:
+            return [min(fives)], None
+        if index.open_fours[attacker]:
+            replies, _ = self._defences(attacker)
+            return (replies, None) if replies else (None, (0, INF))
+        return None, (INF, 0)   # not a threat
+
+    def _mid(self, attacker, is_or, thpn, thdn):
+        # search a node until its pn reaches thpn or its dn reaches thdn
+        key = (self.symmetry.canonical()[0], attacker, is_or)
+        pn, dn, work = self._lookup(key)
+        if pn >= thpn or dn >= thdn:
+            return
+        self.nodes += 1
+        if self.nodes > self.max_nodes or (self.nodes & 63 == 0 and time.time() > self.deadline):
+            self.timeout = True
+        if self.timeout:
+            return
+        moves, numbers = self._expand(attacker, is_or)
+        if moves is None:
+            self.tt.put(key, numbers + (1,))
+            return
+
+        player = attacker if is_or else 3 - attacker
+        start = self.nodes
+        while True:
+            children = [self._lookup(self._child_key(c, player, attacker, not is_or)) for c in moves]
+            # the numbers of the side to move come first: (pn, dn) at OR nodes, (dn, pn) at AND nodes
+            own, other = (0, 1) if is_or else (1, 0)
+            best = min(range(len(moves)), key=lambda k: children[k][own])
+            first = children[best][own]
+            total = min(INF, sum(child[other] for child in children))
+            pn, dn = (first, total) if is_or else (total, first)
+            if pn >= thpn or dn >= thdn or self.timeout:
+                break
+            second = min([child[own] for k, child in enumerate(children) if k != best] or [INF])
+            if is_or:
+                child_thpn = min(thpn, second + 1)
+                child_thdn = min(INF, thdn - dn + children[best][1])
+            else:
+                child_thdn = min(thdn, second + 1)
+                child_thpn = min(INF, thpn - pn + children[best][0])
+            self._make(moves[best], player)
+            try:
+                self._mid(attacker, not is_or, child_thpn, child_thdn)
+            finally:
+                self._unmake(moves[best], player)
+        self.tt.put(key, (pn, dn, work + self.nodes - start + 1))
+
+    def _line(self, attacker):
+        # the winning line from a proven OR node: a proven move, then the first reply, and so on
+        index = self.index
+        if index.fives[attacker]:
+            return [min(index.fives[attacker])]
+        for c in self._attacks(attacker, self.vct):
+            if self._lookup(self._child_key(c, attacker, attacker, False))[0] == 0:
+                break
+        else:
+            return []   # the proof was dropped from the table
+        self._make(c, attacker)
+        try:
+            fives = index.fives[attacker]
+            if len(fives) > 1:
+                return [c] + sorted(fives)[:2]
+            if fives:
+                replies = [min(fives)]
+            else:
+                replies, cells = self._defences(attacker)
+                if not replies:
+                    return [c] + self._open_four_line(attacker, min(cells))
+            self._make(replies[0], 3 - attacker)
+            try:
+                return [c, replies[0]] + self._line(attacker)
+            finally:
+                self._unmake(replies[0], 3 - attacker)
+        finally:
+            self._unmake(c, attacker)
@@ -1,15 +1,33 @@
+import os
 import time
 import pisqpipe as pp
 from pisqpipe import DEBUG_EVAL, DEBUG
 import algorithm
-from copy import deepcopy
+from alphabeta import AlphaBeta
+from book import OpeningBook
+from bitboard import BitBoard
+from timemanager import TimeManager
 
 
 pp.infotext = 'name="HMCTS", author="ElenZhang", version="1.0", country="China", www="https://github.com/zhangyilang/mdpwithmcts"'
 
 MAX_BOARD = 100
-board = [[0 for i in range(MAX_BOARD)] for j in range(MAX_BOARD)]
-# player = algorithm.RHMCTSPlayer()
+board = BitBoard([[0 for i in range(MAX_BOARD)] for j in range(MAX_BOARD)])
+timer = TimeManager()
+# search with RHMCTS instead of get_action_fast_version, reusing the tree from move to move
+USE_RHMCTS = True
+# keep searching with RHMCTS while the opponent thinks
+PONDER = False
+# without RHMCTS, search with the alpha-beta engine instead of get_action_fast_version
+USE_ALPHABETA = False
+player = algorithm.RHMCTSPlayer()
+searcher = AlphaBeta()
+# the opening book next to this file, played before any search when it has the position
+BOOK = os.path.join(os.path.dirname(os.path.abspath(__file__)), "book.bin")
+try:
+    book = OpeningBook(BOOK) if os.path.exists(BOOK) else None
+except ValueError:
+    book = None     # a book of an older format, to build again
 # stepcount = None
 
 
@@ -21,7 +39,9 @@ def brain_init():
         pp.pipeOut("ERROR Maximal board size is {}".format(MAX_BOARD))
         return
     global board
-    board = [[0 for i in range(pp.width)] for j in range(pp.height)]
+    board = BitBoard([[0 for i in range(pp.width)] for j in range(pp.height)])
+    player.stop_pondering()
+    player.rhmcts.reset()
     pp.pipeOut("OK")
 
 
@@ -29,6 +49,8 @@ def brain_restart():
     for x in range(pp.width):
         for y in range(pp.height):
             board[x][y] = 0
+    player.stop_pondering()
+    player.rhmcts.reset()
     pp.pipeOut("OK")
 
 
@@ -40,7 +62,9 @@ def brain_my(x, y):
     if isFree(x, y):
         board[x][y] = 1
         # update RHMCT
-        # player.rhmcts.update_with_move((x, y))
+        if USE_RHMCTS:
+            player.stop_pondering()
+            player.rhmcts.sync(board, 2, (x, y))
     else:
         pp.pipeOut("ERROR my move [{},{}]".format(x, y))
 
@@ -49,7 +73,10 @@ def brain_opponents(x, y):
     if isFree(x, y):
         board[x][y] = 2
         # update RHMCT
-        # player.rhmcts.update_with_move((x, y))
+        if USE_RHMCTS:
+            # continue from the subtree of the move the opponent made
+            player.stop_pondering()
+            player.rhmcts.sync(board, 1, (x, y))
     else:
         pp.pipeOut("ERROR opponents's move [{},{}]".format(x, y))
 
@@ -63,7 +90,13 @@ def brain_block(x, y):
 
 def brain_takeback(x, y):
     if x >= 0 and y >= 0 and x < pp.width and y < pp.height and board[x][y] != 0:
+        who = board[x][y]
         board[x][y] = 0
+        if USE_RHMCTS and who in (1, 2):
+            # back to the node of the position before the move, if the tree still has it (the tree is
+            # reset after a takeback of more than one move); a block stone is synced by the next turn
+            player.stop_pondering()
+            player.rhmcts.sync(board, who)
         return 0
     return 2
 
@@ -81,13 +114,35 @@ def brain_turn():
     #                 stepcount += 1
     # time_limit = 5 + time_start if stepcount > 3 else -1
     # (x, y) = player.get_action(board, time_limit)
-    board_copy = deepcopy(board)
-    x, y = algorithm.get_action_fast_version(board_copy)
-    pp.do_mymove(x, y)
+    timer.start(pp.info_timeout_turn, pp.info_timeout_match, pp.info_time_left)
+    move = book.move(board, 1) if book is not None else None
+    if move is not None:
+        x, y = move
+    elif USE_RHMCTS:
+        player.stop_pondering()
+        # half of max_memory for the search, the rest is left to the interpreter
+        player.rhmcts.set_max_memory(pp.info_max_memory // 2, (len(board), len(board[0])))
+        player.rhmcts.sync(board, 1)
+        x, y = player.get_action(board, timer)
+        if DEBUG:
+            pp.pipeOut("DEBUG memory {}".format(player.memory_stats()))
+    elif USE_ALPHABETA:
+        searcher.set_max_memory(pp.info_max_memory // 2)
+        x, y = searcher.get_action(board, timer.deadline)
+        if DEBUG:
+            pp.pipeOut("DEBUG depth {} nodes {} memory {}".format(searcher.depth, searcher.nodes, searcher.memory()))
+    else:
+        x, y = algorithm.get_action_fast_version(board, timer.deadline)
+    pp.do_mymove(x, y)    # brain_my moves the root of the tree
+    if USE_RHMCTS and PONDER:
+        player.ponder(board, 2)
     # stepcount += 1
 
 
 def brain_end():
+    if book is not None:
+        book.close()
+    player.rhmcts.close()
     pp.pipeOut('Brain ends.')
 
 
@@ -0,0 +1,266 @@
+"""
+Array-backed store of the MCTS nodes.
+
+The nodes are kept as a struct of NumPy arrays indexed by an integer node id instead of one
+Python object (and one children dict) per node:
+
+    node arrays: P (prior), Q (value), visits, first (first edge), count (number of edges)
+    edge arrays: x, y (the move), child (the node id reached by the move)
+
+The edges of a node are allocated together when it is expanded, so its children are the
+range first .. first + count of the edge arrays. UCT selection over the children is one
+vectorized argmax, and backpropagation updates the nodes of a path in one go. A child may be
+reached from several parents (see the transposition table in RHMCTS), so nodes do not keep a
+parent pointer and the search backpropagates along the path it took.
+
+Several threads may search one store. Every change of the arrays is made under `lock`, and the
+nodes on the path of a running playout carry a virtual loss until it is backpropagated, so
+that the other threads select different children meanwhile.
+
+The store may be given a budget of nodes (max_nodes, and as many edges). The arrays never grow
+beyond it: the search checks room() before an expansion, and frees the subtrees below the least
+visited nodes with prune() and compact() when the store is full.
+"""
+import threading
+import numpy as np
+
+
+class NodeStore(object):
+    """
+    The nodes of one search. Node ids are ints, and the arrays grow by doubling.
+    """
+    NODE_ARRAYS = ("P", "Q", "visits", "virtual", "first", "count")
+    EDGE_ARRAYS = ("x", "y", "child")
+    DTYPES = (np.float64, np.float64, np.int32, np.int32, np.int32, np.int32, np.int16, np.int16, np.int32)
+
+    def __init__(self, capacity=1024, virtual_loss=1., max_nodes=None):
+        """
+        :param virtual_loss: the value a node in use by another playout counts as, per playout
+        :param max_nodes: the most nodes (and edges) the store may hold, None for no limit
+        """
+        self.max_nodes = max_nodes
+        self.lock = threading.RLock()
+        self.virtual_loss = virtual_loss
+        self.node_capacity = 0
+        self.edge_capacity = 0
+        self.P = np.zeros(0, dtype=np.float64)      # prior probability for winning
+        self.Q = np.zeros(0, dtype=np.float64)      # Q-value (exploitation)
+        self.visits = np.zeros(0, dtype=np.int32)   # number of visits
+        self.virtual = np.zeros(0, dtype=np.int32)  # number of running playouts through the node
+        self.first = np.zeros(0, dtype=np.int32)
+        self.count = np.zeros(0, dtype=np.int32)
+        self.x = np.zeros(0, dtype=np.int16)
+        self.y = np.zeros(0, dtype=np.int16)
+        self.child = np.zeros(0, dtype=np.int32)
+        self.size = 0
+        self.edges = 0
+        self._grow_nodes(capacity)
+        self._grow_edges(capacity)
+
+    def _grow_nodes(self, capacity):
+        for name in self.NODE_ARRAYS:
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+        self.node_capacity = capacity
+
+    def _grow_edges(self, capacity):
+        for name in self.EDGE_ARRAYS:
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self.edges] = old[:self.edges]
+            setattr(self, name, new)
+        self.edge_capacity = capacity
+
+    def new_node(self, prior_P):
+        if self.size == self.node_capacity:
+            self._grow_nodes(self._capacity(2 * self.node_capacity, self.size + 1))
+        node = self.size
+        self.P[node] = prior_P
+        self.Q[node] = 0
+        self.visits[node] = 0
+        self.virtual[node] = 0
+        self.first[node] = 0
+        self.count[node] = 0
+        self.size += 1
+        return node
+
+    def expand(self, node, action_prob, child_of=None):
+        """
+        expansion stage, give a leaf node one child per (action, probability)
+        :param child_of: child_of(action, prob) returns the node id reached by action, which may be
+            shared with another parent; by default a new node is made
+        """
+        actions, seen = [], set()
+        for action, prob in action_prob:
+            if action not in seen:
+                seen.add(action)
+                actions.append((action, prob))
+        while self.edges + len(actions) > self.edge_capacity:
+            self._grow_edges(self._capacity(2 * self.edge_capacity, self.edges + len(actions)))
+        first = self.edges
+        for k, (action, prob) in enumerate(actions):
+            self.x[first + k], self.y[first + k] = action
+            self.child[first + k] = child_of(action, prob) if child_of else self.new_node(prob)
+        self.first[node] = first
+        self.count[node] = len(actions)
+        self.edges += len(actions)
+
+    def _capacity(self, wanted, needed):
+        # the size to grow an array to, within the budget unless more is needed
+        if self.max_nodes is not None:
+            wanted = min(wanted, self.max_nodes)
+        return max(wanted, needed)
+
+    def room(self, n):
+        """
+        whether n more nodes and edges fit in the budget
+        """
+        return self.max_nodes is None or (self.size + n <= self.max_nodes and self.edges + n <= self.max_nodes)
+
+    @classmethod
+    def bytes_per_node(cls):
+        # the bytes of one node and one edge in the arrays
+        return sum(np.dtype(dtype).itemsize for dtype in cls.DTYPES)
+
+    def is_leaf(self, node):
+        return self.count[node] == 0
+
+    def select(self, node, c_puct):
+        """
+        selection stage
+        :return: (action, child) of the child with the highest Q + U
+        """
+        first = self.first[node]
+        end = first + self.count[node]
+        children = self.child[first:end]
+        visits = self.visits[children]
+        Q = self.Q[children]
+        virtual = self.virtual[children]
+        parent_visits = self.visits[node] + self.virtual[node]
+        if virtual.any():
+            # count every running playout through a child as a finished one which lost
+            Q = np.where(virtual > 0, (Q * visits - self.virtual_loss * virtual) / np.maximum(visits + virtual, 1), Q)
+            visits = visits + virtual
+        U = c_puct * self.P[children] * np.sqrt(parent_visits) / (1 + visits)
+        k = first + int(np.argmax(Q + U))
+        return (int(self.x[k]), int(self.y[k])), int(self.child[k])
+
+    def children(self, node):
+        """
+        :return: a list of (action, child)
+        """
+        first = self.first[node]
+        end = first + self.count[node]
+        return [((int(x), int(y)), int(c)) for x, y, c in zip(self.x[first:end], self.y[first:end],
+                                                              self.child[first:end])]
+
+    def best_child(self, node):
+        """
+        :return: (action, child) of the child with the highest Q
+        """
+        first = self.first[node]
+        end = first + self.count[node]
+        k = first + int(np.argmax(self.Q[self.child[first:end]]))
+        return (int(self.x[k]), int(self.y[k])), int(self.child[k])
+
+    def find_child(self, node, action):
+        """
+        :return: the child reached by action, or None if the node has no such child
+        """
+        first = self.first[node]
+        end = first + self.count[node]
+        found = np.flatnonzero((self.x[first:end] == action[0]) & (self.y[first:end] == action[1]))
+        return int(self.child[first + found[0]]) if len(found) else None
+
+    def add_virtual(self, node):
+        self.virtual[node] += 1
+
+    def release_virtual(self, path):
+        """
+        take back the virtual loss of a playout along path
+        """
+        self.virtual[np.asarray(path, dtype=np.int64)] -= 1
+
+    def update_path(self, path, leaf_value):
+        """
+        backpropagation from the last node of path to the root, switching the point of view at
+        every level; a path never visits a node twice, since every move adds a stone
+        """
+        path = np.asarray(path, dtype=np.int64)
+        depth = len(path) - 1 - np.arange(len(path))
+        values = np.where(depth % 2, -leaf_value, leaf_value).astype(np.float64)
+        self.visits[path] += 1
+        self.Q[path] += (values - self.Q[path]) / self.visits[path]   # running average
+
+    def _edge_index(self, nodes):
+        # the indices of the edges of all nodes, node by node
+        counts = self.count[nodes].astype(np.int64)
+        starts = self.first[nodes].astype(np.int64) - (np.cumsum(counts) - counts)
+        return np.repeat(starts, counts) + np.arange(counts.sum())
+
+    def reachable(self, root):
+        """
+        :return: a bool array marking the nodes which can be reached from root
+        """
+        mark = np.zeros(self.size, dtype=bool)
+        mark[root] = True
+        frontier = np.array([root], dtype=np.int64)
+        while len(frontier):
+            children = self.child[self._edge_index(frontier)]
+            frontier = np.unique(children[~mark[children]])
+            mark[frontier] = True
+        return mark
+
+    def prune(self, root, fraction=0.5):
+        """
+        turn the least visited fraction of the inner nodes other than root back into leaves; the
+        subtrees below them are freed by the next compact(root)
+        """
+        inner = np.flatnonzero(self.count[:self.size] > 0)
+        inner = inner[inner != root]
+        cut = inner[np.argsort(self.visits[inner], kind="stable")[:int(len(inner) * fraction)]]
+        self.count[cut] = 0
+        return len(cut)
+
+    def compact(self, root, capacity=1024):
+        """
+        free the nodes which can not be reached from root any more, moving the others to the front
+        :return: the new id of every old node, -1 for the freed ones
+        """
+        keep = np.flatnonzero(self.reachable(root))
+        ids = np.full(self.size, -1, dtype=np.int64)
+        ids[keep] = np.arange(len(keep))
+        edges = self._edge_index(keep)
+        counts = self.count[keep]
+        first = np.cumsum(counts) - counts
+
+        node_capacity = self._capacity(max(capacity, 2 * len(keep)), len(keep))
+        for name in self.NODE_ARRAYS:
+            new = np.zeros(node_capacity, dtype=getattr(self, name).dtype)
+            new[:len(keep)] = getattr(self, name)[keep]
+            setattr(self, name, new)
+        self.first[:len(keep)] = first
+        edge_capacity = self._capacity(max(capacity, 2 * len(edges)), len(edges))
+        for name in self.EDGE_ARRAYS:
+            new = np.zeros(edge_capacity, dtype=getattr(self, name).dtype)
+            new[:len(edges)] = getattr(self, name)[edges]
+            setattr(self, name, new)
+        self.child[:len(edges)] = ids[self.child[:len(edges)]]
+        self.node_capacity, self.edge_capacity = node_capacity, edge_capacity
+        self.size, self.edges = len(keep), len(edges)
+        return ids
+
+    def clear(self):
+        self.size = 0
+        self.edges = 0
+
+    def __len__(self):
+        return self.size
+
+    def nbytes(self):
+        """
+        the memory held by the arrays, in bytes
+        """
+        return sum(getattr(self, name).nbytes for name in self.NODE_ARRAYS + self.EDGE_ARRAYS)
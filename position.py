@@ -0,0 +1,92 @@
+from bitboard import BitBoard
+from threats import ThreatIndex
+from utils import Frontier
+from rollout import RolloutBoard
+from zobrist import zobrist_keys, SymmetricHash
+
+
+class Position(object):
+    """
+    A game position: the board, the side to move, the stones of each player and the moves made
+    so far. The search makes and unmakes moves on one Position instead of copying the board;
+    the threat index, the candidate frontier, the rollout board and the Zobrist hashes of the board
+    and its symmetric boards are updated with every move.
+    """
+    def __init__(self, board, player=1):
+        """
+        :param board: a 2-d list or BitBoard, copied once
+        :param player: the side to move, 1 or 2
+        """
+        self.board = BitBoard(board)
+        self.player = player
+        self.moves = []     # stack of (move, player)
+        self.stones = {1: [], 2: []}
+        for x, row in enumerate(self.board):
+            for y, v in enumerate(row):
+                if v in self.stones:
+                    self.stones[v].append((x, y))
+        self.threats = ThreatIndex(self.board)
+        self.frontier = Frontier(self.board)
+        self.rollout = RolloutBoard(self.board)
+        _, self.side_key = zobrist_keys(len(self.board), len(self.board[0]))
+        self.symmetry = SymmetricHash(self.board)
+
+    def make(self, move, player=None):
+        """
+        place a stone on move, for the side to move unless player is given; the other player moves next
+        """
+        if player is None:
+            player = self.player
+        x, y = move
+        self.board[x][y] = player
+        self.stones[player].append(move)
+        self.threats.make(x, y, player)
+        self.frontier.make(x, y)
+        self.rollout.play(move, player)
+        self.symmetry.toggle(x, y, player)
+        self.moves.append((move, player))
+        self.player = 3 - player
+
+    def unmake(self):
+        """
+        take back the last move made, and return it
+        """
+        move, player = self.moves.pop()
+        x, y = move
+        self.board[x][y] = 0
+        self.stones[player].pop()
+        self.threats.unmake()
+        self.frontier.unmake(x, y)
+        self.rollout.unplay(move)
+        self.symmetry.toggle(x, y, player)
+        self.player = player
+        return move
+
+    def unmake_to(self, ply):
+        """
+        take back moves until only ply moves are left on the stack
+        """
+        while len(self.moves) > ply:
+            self.unmake()
+
+    def ply(self):
+        return len(self.moves)
+
+    def last_move(self):
+        return self.moves[-1][0] if self.moves else None
+
+    def canonical_key(self):
+        """
+        the key of the position as canonical hash, the same for its rotations and reflections
+        :return: the key, and the symmetry t mapping moves to the canonical board (see SymmetricHash)
+        """
+        h, t = self.symmetry.canonical()
+        return (h ^ self.side_key if self.player == 2 else h), t
+
+    def canonical_child_key(self, move):
+        """
+        the canonical key of the position after the side to move plays move, without making it
+        """
+        x, y = move
+        h, t = self.symmetry.child(x, y, self.player)
+        return (h ^ self.side_key if self.player == 1 else h), t
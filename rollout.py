@@ -0,0 +1,403 @@
+"""
+Fast rollout policy.
+
+A RolloutBoard keeps, for every window of 5 cells in the 4 directions, the number of stones
+of each player in it, and for every cell the sum of the pattern weights of the windows
+through it (WINDOW_WEIGHTS, by the number of stones of a window holding the stones of one
+player only). A move changes the 20 windows through its cell, so the weights are updated
+locally, and the rollout moves are sampled in proportion to them.
+
+The windows with 4 stones of one player give the cells completing five, and the windows
+with 3 stones the cells which may make an open four. Only when there are such windows the
+heuristics are checked, in the order of ThreatIndex.threat_action: five, then open four,
+for the player to move then the opponent.
+
+RolloutEngine plays many rollouts from one board together on NumPy arrays.
+"""
+import time
+from bisect import bisect_right
+from itertools import accumulate
+from random import random, choice, getrandbits
+import numpy as np
+
+
+# weight of a window holding n stones of one player and no stone of the other one
+WINDOW_WEIGHTS = (0, 1, 4, 32, 256, 0)
+# the change of the code of a window when a cell value is placed in it, blocks kill the window
+ADD = (0, 1, 6, 36)
+CODES = 36 * 5 + 1
+DIRECTIONS = ((1, 0), (0, 1), (1, 1), (1, -1))
+
+
+def _pure(code):
+    # (player, stones) of a window holding the stones of one player only, else (0, 0)
+    n1, n2 = code % 6, code // 6
+    if code < 36 and n2 == 0 and n1:
+        return 1, n1
+    if code < 36 and n1 == 0 and n2:
+        return 2, n2
+    return 0, 0
+
+
+VALUE = [WINDOW_WEIGHTS[_pure(code)[1]] for code in range(CODES)]
+FOUR_OF = [_pure(code)[0] if _pure(code)[1] == 4 else 0 for code in range(CODES)]
+THREE_OF = [_pure(code)[0] if _pure(code)[1] == 3 else 0 for code in range(CODES)]
+FIVE = (0, 5, 30)
+# the change of the code of a window of 6 cells when one of its ends is taken
+OPEN_END = 216
+# windows which give cells of fours or threes
+MARKED = [bool(FOUR_OF[code] or THREE_OF[code]) for code in range(CODES)]
+
+_geometry = dict()
+
+
+def geometry(height, width):
+    """
+    :return:
+        windows: the 5 cells (x * width + y) of every window
+        cell_windows: the windows through every cell
+        rays: rays[c][d] = (cells before c, cells after c) along direction d, up to 5 of each
+    """
+    if (height, width) not in _geometry:
+        windows, cell_windows = [], [[] for _ in range(height * width)]
+        rays = [[None] * 4 for _ in range(height * width)]
+        for d, (dx, dy) in enumerate(DIRECTIONS):
+            for x in range(height):
+                for y in range(width):
+                    cells = [(x + k * dx, y + k * dy) for k in range(5)]
+                    if all(0 <= i < height and 0 <= j < width for i, j in cells):
+                        for i, j in cells:
+                            cell_windows[i * width + j].append(len(windows))
+                        windows.append(tuple(i * width + j for i, j in cells))
+                    ray = []
+                    for sign in (-1, 1):
+                        ray.append([(x + sign * k * dx) * width + y + sign * k * dy for k in range(1, 6)
+                                    if 0 <= x + sign * k * dx < height and 0 <= y + sign * k * dy < width])
+                    rays[x * width + y][d] = tuple(ray)
+        _geometry[(height, width)] = (windows, cell_windows, rays)
+    return _geometry[(height, width)]
+
+
+class RolloutBoard(object):
+    """
+    The board of the rollouts, with cells numbered x * width + y. Position keeps one up to date
+    through make/unmake; a rollout plays on a copy() and throws it away.
+    """
+    def __init__(self, board=None):
+        if board is None:
+            return
+        height, width = len(board), len(board[0])
+        self.width = width
+        self.windows, self.cell_windows, self.rays = geometry(height, width)
+        self.values = [0] * (height * width)
+        self.code = [0] * len(self.windows)
+        self.weight = [0] * (height * width)
+        self.fours = ({}, {}, {})     # per player, cell completing five -> number of windows
+        self.threes = ({}, {}, {})    # per player, empty cell of a window with 3 stones -> number of windows
+        self.empty = height * width
+        for x, row in enumerate(board):
+            for y, v in enumerate(row):
+                if v:
+                    self.play_cell(x * width + y, v)
+
+    def copy(self):
+        other = RolloutBoard()
+        other.width = self.width
+        other.windows, other.cell_windows, other.rays = self.windows, self.cell_windows, self.rays
+        other.values = self.values[:]
+        other.code = self.code[:]
+        other.weight = self.weight[:]
+        other.fours = tuple(dict(cells) for cells in self.fours)
+        other.threes = tuple(dict(cells) for cells in self.threes)
+        other.empty = self.empty
+        return other
+
+    @staticmethod
+    def _count(cells, cell, n):
+        n += cells.get(cell, 0)
+        if n:
+            cells[cell] = n
+        else:
+            del cells[cell]
+
+    def play_cell(self, c, player):
+        """
+        place a stone (or a block, 3) on cell c
+        :return: whether it makes five
+        """
+        values, code, weight, windows = self.values, self.code, self.weight, self.windows
+        value, marked = VALUE, MARKED
+        values[c] = player
+        self.empty -= 1
+        add = ADD[player]
+        five = FIVE[player % 3]
+        made_five = False
+        for wi in self.cell_windows[c]:
+            old = code[wi]
+            new = old + add
+            code[wi] = new
+            d = value[new] - value[old]
+            if d:
+                for e in windows[wi]:
+                    if not values[e]:
+                        weight[e] += d
+            if marked[old] or marked[new]:
+                self._mark(windows[wi], old, new, player, c, 1)
+            if new == five:
+                made_five = True
+        weight[c] = 0
+        return made_five
+
+    def unplay_cell(self, c):
+        """
+        take back the stone on cell c
+        """
+        values, code, weight, windows = self.values, self.code, self.weight, self.windows
+        value, marked = VALUE, MARKED
+        player = values[c]
+        values[c] = 0
+        self.empty += 1
+        add = ADD[player]
+        total = 0
+        for wi in self.cell_windows[c]:
+            old = code[wi]
+            new = old - add
+            code[wi] = new
+            total += value[new]
+            d = value[new] - value[old]
+            if d:
+                for e in windows[wi]:
+                    if not values[e] and e != c:
+                        weight[e] += d
+            if marked[old] or marked[new]:
+                self._mark(windows[wi], old, new, player, c, -1)
+        weight[c] = total
+
+    def _mark(self, cells, old, new, player, c, sign):
+        # update the cells of fours and threes when the window of cells changes from old to new, the
+        # stone of player being placed on (sign 1) or taken from (sign -1) cell c
+        values, count = self.values, self._count
+        if sign > 0:
+            if FOUR_OF[old]:
+                count(self.fours[FOUR_OF[old]], c, -1)
+            elif FOUR_OF[new]:
+                for e in cells:
+                    if values[e] == 0:
+                        count(self.fours[player], e, 1)
+            if THREE_OF[old]:
+                for e in cells:
+                    if values[e] == 0 or e == c:
+                        count(self.threes[THREE_OF[old]], e, -1)
+            elif THREE_OF[new]:
+                for e in cells:
+                    if values[e] == 0:
+                        count(self.threes[player], e, 1)
+        else:
+            if FOUR_OF[old]:
+                for e in cells:
+                    if values[e] == 0 and e != c:
+                        count(self.fours[player], e, -1)
+            elif FOUR_OF[new]:
+                count(self.fours[FOUR_OF[new]], c, 1)
+            if THREE_OF[old]:
+                for e in cells:
+                    if values[e] == 0 and e != c:
+                        count(self.threes[player], e, -1)
+            elif THREE_OF[new]:
+                for e in cells:
+                    if values[e] == 0:
+                        count(self.threes[THREE_OF[new]], e, 1)
+
+    def open_four(self, c, player):
+        """whether player makes an open four by playing the empty cell c"""
+        values = self.values
+        for back, forward in self.rays[c]:
+            k1 = 0
+            while k1 < len(back) and values[back[k1]] == player:
+                k1 += 1
+            k2 = 0
+            while k2 < len(forward) and values[forward[k2]] == player:
+                k2 += 1
+            if k1 + k2 == 3 and k1 < len(back) and k2 < len(forward) \
+                    and values[back[k1]] == 0 and values[forward[k2]] == 0:
+                return True
+        return False
+
+    def choose_cell(self, player):
+        """
+        the rollout move of player, or None if the board is full
+        """
+        opponent = 3 - player
+        if self.fours[player]:
+            return next(iter(self.fours[player]))
+        if self.fours[opponent]:
+            return next(iter(self.fours[opponent]))
+        for p in (player, opponent):
+            # an open four 0pppp0 covers two windows of 3 stones through the played cell
+            for c, n in self.threes[p].items():
+                if n > 1 and self.open_four(c, p):
+                    return c
+        cumulative = list(accumulate(self.weight))
+        if cumulative[-1] > 0:
+            return bisect_right(cumulative, random() * cumulative[-1])
+        empty = [c for c, v in enumerate(self.values) if v == 0]
+        return choice(empty) if empty else None
+
+    def play(self, move, player):
+        return self.play_cell(move[0] * self.width + move[1], player)
+
+    def unplay(self, move):
+        self.unplay_cell(move[0] * self.width + move[1])
+
+    def choose(self, player):
+        c = self.choose_cell(player)
+        return divmod(c, self.width) if c is not None else None
+
+    def is_full(self):
+        return self.empty == 0
+
+
+_engines = dict()
+
+
+def rollout_engine(height, width):
+    if (height, width) not in _engines:
+        _engines[(height, width)] = RolloutEngine(height, width)
+    return _engines[(height, width)]
+
+
+def engine_bytes():
+    """
+    the memory held by the arrays of the cached engines, in bytes
+    """
+    return sum(engine.nbytes() for engine in _engines.values())
+
+
+class RolloutEngine(object):
+    """
+    Many rollouts from one RolloutBoard at once. The games are rows of NumPy arrays: the cell
+    values, the window codes, the cell weights (0 on occupied cells) and the number of windows
+    with 4 stones of each player. One step plays a move in every game, with the updates of the
+    20 windows through the moves gathered and scattered for all games together.
+
+    Moves are chosen as in RolloutBoard.choose_cell. For the open fours the engine also keeps the
+    codes of the windows of 6 cells: the stones of each player in the middle 4 cells, plus
+    OPEN_END for every occupied end, so that an open three is a single code. Finished games keep
+    playing an extra dummy cell, which belongs to dummy windows only.
+    """
+    def __init__(self, height, width):
+        windows, cell_windows, _ = geometry(height, width)
+        self.n = n = height * width
+        self.dummy_window = len(windows)
+        self.windows = np.full((len(windows) + 1, 5), n, dtype=np.int64)
+        self.windows[:len(windows)] = windows
+        self.cell_windows = np.full((n + 1, 20), len(windows), dtype=np.int64)
+        for c, ws in enumerate(cell_windows):
+            self.cell_windows[c, :len(ws)] = ws
+        self.value = np.array(VALUE, dtype=np.int64)
+        self.four = np.array([[FOUR_OF[code] == p for code in range(CODES)] for p in range(3)], dtype=np.int64)
+
+        windows6, cell_windows6 = [], [[] for _ in range(n)]
+        for dx, dy in DIRECTIONS:
+            for x in range(height):
+                for y in range(width):
+                    cells = [(x + k * dx, y + k * dy) for k in range(6)]
+                    if all(0 <= i < height and 0 <= j < width for i, j in cells):
+                        for k, (i, j) in enumerate(cells):
+                            cell_windows6[i * width + j].append((len(windows6), k in (0, 5)))
+                        windows6.append([i * width + j for i, j in cells])
+        self.dummy_window6 = len(windows6)
+        self.windows6 = np.full((len(windows6) + 1, 6), n, dtype=np.int64)
+        self.windows6[:len(windows6)] = windows6
+        self.cell_windows6 = np.full((n + 1, 24), len(windows6), dtype=np.int64)
+        self.is_end = np.zeros((n + 1, 24), dtype=bool)
+        for c, ws in enumerate(cell_windows6):
+            self.cell_windows6[c, :len(ws)] = [w for w, end in ws]
+            self.is_end[c, :len(ws)] = [end for w, end in ws]
+        # both ends empty, and three stones of the player and an empty cell in the middle
+        codes6 = np.arange(3 * OPEN_END)
+        self.open3 = np.array([codes6 == 3 * ADD[p] if p else codes6 < 0 for p in range(3)], dtype=np.int64)
+
+    def nbytes(self):
+        return sum(array.nbytes for array in vars(self).values() if isinstance(array, np.ndarray))
+
+    def run(self, rollout, player, cells, limit_depth=50, deadline=None, rng=None):
+        """
+        :param rollout: the RolloutBoard to start every game from
+        :param player: the player of the first move of the games
+        :param cells: the first move (a cell) of every game, then limit_depth moves are sampled
+        :param deadline: the time the unfinished games are called a tie
+        :return: an int array of the winners, 0 for a tie, 1 or 2
+        """
+        if rng is None:
+            rng = np.random.default_rng(getrandbits(64))
+        n, games = self.n, len(cells)
+        rows = np.arange(games)
+        values = np.tile(np.array(rollout.values + [0], dtype=np.int8), (games, 1))
+        code = np.tile(np.array(rollout.code + [0], dtype=np.int64), (games, 1))
+        weight = np.tile(np.array(rollout.weight + [0], dtype=np.int64), (games, 1))
+        fours = np.tile(self.four[:, code[0]].sum(axis=1), (games, 1))    # (games, 3)
+        code6 = np.zeros(len(self.windows6), dtype=np.int64)
+        for k in range(6):
+            cell_values = np.array(rollout.values + [0])[self.windows6[:, k]]
+            code6 += (cell_values != 0) * OPEN_END if k in (0, 5) else np.array(ADD)[cell_values]
+        code6[self.dummy_window6] = 0
+        threes = np.tile(self.open3[:, code6].sum(axis=1), (games, 1))
+        code6 = np.tile(code6, (games, 1))
+        winners = np.zeros(games, dtype=np.int64)
+        alive = np.ones(games, dtype=bool)
+        move = np.asarray(cells, dtype=np.int64)
+        for depth in range(limit_depth + 1):
+            if depth > 0:
+                if deadline is not None and time.time() > deadline:
+                    break
+                move = self.choose(values, code, code6, weight, fours, threes, player, alive, rng)
+            move = np.where(alive, move, n)
+            values[rows, move] = player
+            values[:, n] = 0
+            weight[rows, move] = 0
+            windows = self.cell_windows[move]                   # (games, 20)
+            old = code[rows[:, None], windows]
+            new = old + ADD[player]
+            code[rows[:, None], windows] = new
+            code[:, self.dummy_window] = 0
+            fours += (self.four[:, new] - self.four[:, old]).sum(axis=2).T
+            windows6 = self.cell_windows6[move]                 # (games, 24)
+            old6 = code6[rows[:, None], windows6]
+            new6 = old6 + np.where(self.is_end[move], OPEN_END, ADD[player])
+            code6[rows[:, None], windows6] = new6
+            code6[:, self.dummy_window6] = 0
+            threes += (self.open3[:, new6] - self.open3[:, old6]).sum(axis=2).T
+            # the weight changes of the windows, on their empty cells
+            delta = self.value[new] - self.value[old]
+            cells = self.windows[windows]                       # (games, 20, 5)
+            delta = delta[:, :, None] * (values[rows[:, None, None], cells] == 0)
+            np.add.at(weight.reshape(-1), (rows[:, None, None] * (n + 1) + cells).reshape(-1), delta.reshape(-1))
+            five = alive & (new == FIVE[player]).any(axis=1)
+            winners[five] = player
+            alive &= ~five
+            alive &= (values[:, :n] == 0).any(axis=1)   # a full board is a tie
+            if not alive.any():
+                break
+            player = 3 - player
+        return winners
+
+    def choose(self, values, code, code6, weight, fours, threes, player, alive, rng):
+        # the next move of every game: five, open four (each for player then the opponent), or
+        # sampled by the weights; the checks are in reverse order so that the first one wins
+        n = self.n
+        cumulative = np.cumsum(weight[:, :n], axis=1)
+        total = cumulative[:, -1]
+        move = (cumulative <= (rng.random(len(values)) * total)[:, None]).sum(axis=1)
+        for g in np.flatnonzero(alive & (total == 0)):
+            move[g] = rng.choice(np.flatnonzero(values[g, :n] == 0))
+        for p in (3 - player, player):
+            for g in np.flatnonzero(alive & (threes[:, p] > 0)):
+                window = self.windows6[int(np.argmax(self.open3[p][code6[g]]))][1:5]
+                move[g] = window[values[g, window] == 0][0]
+        for p in (3 - player, player):
+            for g in np.flatnonzero(alive & (fours[:, p] > 0)):
+                w = int(np.argmax(self.four[p][code[g]]))
+                window = self.windows[w]
+                move[g] = window[values[g, window] == 0][0]
+        return move
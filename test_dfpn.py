@@ -0,0 +1,37 @@
+import time
+import algorithm
+from algorithm import RHMCTS
+from dfpn import DfpnSolver
+from policy import policy_evaluation_function
+
+# player 1 to move, and player 2 has a proven win whose line starts at (7, 10); the defences off
+# the line hold
+PLAYER1 = [(10, 9), (9, 4), (10, 8), (9, 5), (4, 8), (9, 10), (8, 5)]
+PLAYER2 = [(4, 10), (4, 7), (6, 10), (5, 8), (6, 5), (9, 8), (7, 8)]
+DEFENCES = [(6, 7), (7, 5), (7, 6), (7, 12), (8, 11), (9, 6)]
+
+
+def board():
+    board = [[0] * 15 for _ in range(15)]
+    for x, y in PLAYER1:
+        board[x][y] = 1
+    for x, y in PLAYER2:
+        board[x][y] = 2
+    return board
+
+
+def test_refutations_find_the_defences_off_the_line():
+    solver = DfpnSolver(board())
+    proven, line = solver.prove(2, time.time() + 10, 20000)
+    assert proven and line[0] == (7, 10)
+    refutations = solver.refutations(1, line, time.time() + 60, 20000)
+    assert (7, 10) not in refutations
+    assert set(DEFENCES) <= set(refutations)
+
+
+def test_prove_leaves_several_defences_to_the_search():
+    algorithm.time_end = time.time() + 60
+    rhmcts = RHMCTS(policy_evaluation_function, dfpn_time=1.)
+    assert rhmcts.prove(board()) is None
+    assert (7, 10) not in rhmcts.root_moves
+    assert set(DEFENCES) <= set(rhmcts.root_moves)
@@ -0,0 +1,41 @@
+import numpy as np
+from position import Position
+from rollout import rollout_engine, ADD, RolloutEngine
+
+
+def board():
+    # _XXX#_ on row 7: three stones and a blocked cell between empty ends
+    board = [[0] * 15 for _ in range(15)]
+    for y in (6, 7, 8):
+        board[7][y] = 1
+    board[7][9] = 3
+    return board
+
+
+def test_blocked_window_is_not_an_open_three():
+    engine = RolloutEngine(15, 15)
+    assert engine.open3[1][3 * ADD[1]]      # _XXX__
+    assert not engine.open3[1][3 * ADD[1] + ADD[3]]     # _XXX#_
+    assert not engine.open3[2][3 * ADD[2] + ADD[3]]
+
+
+def test_rollouts_play_empty_cells_next_to_a_blocked_cell():
+    position = Position(board(), 2)
+    engine = rollout_engine(15, 15)
+    choose = engine.choose
+    moves = []
+
+    def checked_choose(values, code, code6, weight, fours, threes, player, alive, rng):
+        if not moves:
+            assert not threes[:, 1].any()   # the window of the blocked cell is no open three
+        move = choose(values, code, code6, weight, fours, threes, player, alive, rng)
+        assert (values[alive, move[alive]] == 0).all()
+        moves.append(move)
+        return move
+
+    engine.choose = checked_choose
+    try:
+        winners = engine.run(position.rollout, position.player, [0, 14, 210, 224], rng=np.random.default_rng(0))
+    finally:
+        del engine.choose
+    assert moves and len(winners) == 4
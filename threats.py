@@ -0,0 +1,370 @@
+"""
+Single-pass threat scanner for both players.
+
+analyze_threats reads the board once: for each of the 4 directions the masks of every cell
+value are shifted once per offset, and all the threat windows of both players are matched
+from these shifted masks. The heuristics of policy.py are queries on the ThreatReport.
+
+ThreatIndex keeps the same threats up to date while stones are placed and removed, for the
+rollouts where only one stone changes per step.
+"""
+from bitboard import *
+
+
+# windows of 5 cells with 4 stones and 1 empty cell
+FIVE_PATTERNS = {p: gap_patterns(5, p, 4) for p in (1, 2)}
+# windows of 6 cells with empty ends and 3 stones in the middle 4 cells
+OPEN3_PATTERNS = {p: gap_patterns(6, p, 3, padded=True) for p in (1, 2)}
+# windows of 5 cells with 3 stones and 2 empty cells
+FOUR_PATTERNS = {p: gap_patterns(5, p, 3) for p in (1, 2)}
+# windows of 6 cells with empty ends and 2 stones in the middle 4 cells
+THREE_PATTERNS = {p: gap_patterns(6, p, 2, padded=True) for p in (1, 2)}
+
+
+class ThreatReport(object):
+    """
+    The threats of both players on a board, per player (1 or 2) and direction (column, row,
+    positive diagonal and oblique diagonal):
+        fives: windows with 4 stones and 1 empty cell, which wins the game
+        open_threes: windows of 6 cells with empty ends and 3 stones in between, whose gap makes
+                     an open four
+        fours: cells completing a window of 5 cells with 3 stones and 2 empty cells to 4 stones
+        threes: cells completing a window of 6 cells with empty ends and 2 stones in between to 3
+    Windows are kept as lists of (mask of first cells, shift, empty offsets).
+    """
+    def __init__(self, board):
+        masks, stride = bit_masks(board)
+        self.stride = stride
+        self.shifts = direction_shifts(stride)
+        self.fives = {1: [], 2: []}
+        self.open_threes = {1: [], 2: []}
+        self.four_windows = {1: [], 2: []}
+        self.three_windows = {1: [], 2: []}
+        for shift in self.shifts:
+            # masks[v] >> (k * shift) for the values 0, 1, 2 and the offsets 0 to 5, shared by all windows
+            shifted = [[masks[v] >> (k * shift) for k in range(6)] for v in range(3)]
+            for p in (1, 2):
+                self.fives[p].append(self._match(shifted, shift, FIVE_PATTERNS[p]))
+                self.open_threes[p].append(self._match(shifted, shift, OPEN3_PATTERNS[p]))
+                self.four_windows[p].append(self._match(shifted, shift, FOUR_PATTERNS[p]))
+                self.three_windows[p].append(self._match(shifted, shift, THREE_PATTERNS[p]))
+        # possible placement to achieve four and three, per direction
+        self.fours = {p: [self._cells(windows) for windows in self.four_windows[p]] for p in (1, 2)}
+        self.threes = {p: [self._cells(windows) for windows in self.three_windows[p]] for p in (1, 2)}
+
+    @staticmethod
+    def _match(shifted, shift, patterns):
+        matched = []
+        for pattern, offsets in patterns:
+            windows = -1
+            for k, value in enumerate(pattern):
+                windows &= shifted[value][k]
+            if windows:
+                matched.append((windows, shift, offsets))
+        return matched
+
+    @staticmethod
+    def _cells(windows):
+        cells = 0
+        for matched, shift, offsets in windows:
+            cells |= spread(matched, shift, offsets)
+        return cells
+
+    def _first(self, directions):
+        # the first window of the first direction having one, as (first bit, shift, empty offsets)
+        for windows in directions:
+            first = None
+            for matched, shift, offsets in windows:
+                start = lowest_bit(matched)
+                if first is None or start < first[0]:
+                    first = (start, shift, offsets)
+            if first is not None:
+                return first
+        return None
+
+    def cell(self, bit):
+        return divmod(bit, self.stride)
+
+    def five_cells(self, player):
+        """mask of the cells where player completes five"""
+        return self._cells(w for windows in self.fives[player] for w in windows)
+
+    def open_four_cells(self, player):
+        """mask of the cells where player makes an open four"""
+        return self._cells(w for windows in self.open_threes[player] for w in windows)
+
+    def five(self, player):
+        """the cell completing five found first by scanning the board, or None"""
+        first = self._first(self.fives[player])
+        if first is None:
+            return None
+        start, shift, (d,) = first
+        return self.cell(start + d * shift)
+
+    def open_four(self, player):
+        """the gap of the first open three of player, which makes an open four, or None"""
+        first = self._first(self.open_threes[player])
+        if first is None:
+            return None
+        start, shift, (d,) = first
+        return self.cell(start + d * shift)
+
+    def block_points(self, player):
+        """the cells blocking the first open three of player: the ends and the gap inside the 4 cells"""
+        first = self._first(self.open_threes[player])
+        if first is None:
+            return []
+        start, shift, (d,) = first
+        offsets = (0, 4) if d == 4 else (1, 5) if d == 1 else (0, d, 5)
+        return [self.cell(start + k * shift) for k in offsets]
+
+    def double_threat_cells(self, player):
+        """mask of the cells making 'double four', 'one four one three' or 'double three' for player"""
+        sets = self.fours[player] + self.threes[player]
+        cells = 0
+        for i in range(8):
+            for j in range(i+1, 8):
+                if j != i+4:
+                    cells |= sets[i] & sets[j]
+        return cells
+
+    def double_threat(self, player):
+        """the double threat cell found first by scanning the board, or None"""
+        sets = self.fours[player] + self.threes[player]
+        windows = self.four_windows[player] + self.three_windows[player]
+        for i in range(8):
+            for j in range(i+1, 8):
+                if j != i+4:
+                    intersect = sets[i] & sets[j]
+                    if intersect:
+                        if intersect & (intersect - 1) == 0:
+                            return self.cell(lowest_bit(intersect))
+                        set_i, set_j = [self._cell_set(windows[k]) for k in (i, j)]
+                        return list(set_i & set_j)[0]
+        return None
+
+    def _cell_set(self, windows):
+        # rebuild the set of cells in the order the window scan adds them, so that
+        # picking from an intersection gives the same cell as a scan over the list board
+        cells = set()
+        for start, shift, offsets in sorted((start, shift, offsets) for matched, shift, offsets in windows
+                                            for start in iter_bits(matched)):
+            for d in offsets:
+                cells.add(self.cell(start + d * shift))
+        return cells
+
+    def has_threats(self, player):
+        """whether player has a five, an open three or a double threat to play"""
+        return bool(any(self.fives[player]) or any(self.open_threes[player])
+                    or self.double_threat_cells(player))
+
+
+def analyze_threats(board):
+    """
+    :param board: a BitBoard or a 2-d list
+    :return: the ThreatReport of both players
+    """
+    return ThreatReport(board)
+
+
+# DOUBLE_THREAT[bits] tells whether a cell with these threat bits (fours in the 4 directions, then
+# threes in the 4 directions) is a double threat: two bits, but not a four and a three in one direction
+DOUBLE_THREAT = [any(bits >> i & 1 and bits >> j & 1 for i in range(8) for j in range(i + 1, 8) if j != i + 4)
+                 for bits in range(256)]
+
+_index_windows = dict()
+
+
+def index_windows(height, width):
+    """
+    all windows of 5 and 6 cells of a height x width board, cells numbered x * width + y
+    :return: for length 5 and 6, (cells of each window, direction of each window, windows through each cell)
+    """
+    if (height, width) not in _index_windows:
+        tables = dict()
+        for length in (5, 6):
+            windows, directions = [], []
+            windows_of = [[] for _ in range(height * width)]
+            # column, row, positive diagonal and oblique diagonal
+            for d, (dx, dy) in enumerate(((1, 0), (0, 1), (1, 1), (1, -1))):
+                for x in range(height):
+                    for y in range(width):
+                        x_end, y_end = x + dx * (length - 1), y + dy * (length - 1)
+                        if not (0 <= x_end < height and 0 <= y_end < width):
+                            continue
+                        cells = tuple((x + dx * k) * width + y + dy * k for k in range(length))
+                        for c in cells:
+                            windows_of[c].append(len(windows))
+                        windows.append(cells)
+                        directions.append(d)
+            tables[length] = (windows, directions, windows_of)
+        _index_windows[(height, width)] = tables
+    return _index_windows[(height, width)]
+
+
+class ThreatIndex(object):
+    """
+    Threats of both players kept up to date stone by stone.
+    Every window of 5 and 6 cells keeps its counts of empty cells and stones, so placing or
+    removing a stone only revisits the windows through its cell. Per player it tracks
+        fives: cells completing five
+        open_fours: cells making an open four (the gap of an open three)
+        bits: per cell, the directions where it completes a four (bits 0-3) or sits in an open
+              three (bits 4-7), the sets of heuristic3
+        doubles: cells whose bits make a double threat
+        threat_cells: cells with any bit set, the moves making a four or an open three
+    """
+    def __init__(self, board):
+        self.height, self.width = len(board), len(board[0])
+        tables = index_windows(self.height, self.width)
+        self.windows5, self.dirs5, self.windows_of5 = tables[5]
+        self.windows6, self.dirs6, self.windows_of6 = tables[6]
+        self.cells = [v for row in board for v in row]
+        n = self.height * self.width
+        self.fives = {1: dict(), 2: dict()}
+        self.open_fours = {1: dict(), 2: dict()}
+        self.kinds = {p: [[0] * n for _ in range(8)] for p in (1, 2)}
+        self.bits = {p: [0] * n for p in (1, 2)}
+        self.doubles = {1: set(), 2: set()}
+        self.threat_cells = {1: set(), 2: set()}
+        self.moves = []
+
+        cells = self.cells
+        self.empty5 = [sum(1 for c in w if cells[c] == 0) for w in self.windows5]
+        self.count5 = {p: [sum(1 for c in w if cells[c] == p) for w in self.windows5] for p in (1, 2)}
+        self.ends6 = [(cells[w[0]] == 0) + (cells[w[5]] == 0) for w in self.windows6]
+        self.empty6 = [sum(1 for c in w[1:5] if cells[c] == 0) for w in self.windows6]
+        self.count6 = {p: [sum(1 for c in w[1:5] if cells[c] == p) for w in self.windows6] for p in (1, 2)}
+        for w in range(len(self.windows5)):
+            self._window5(w, 1)
+        for w in range(len(self.windows6)):
+            self._window6(w, 1)
+
+    @staticmethod
+    def _count(counter, c, sign):
+        n = counter.get(c, 0) + sign
+        if n:
+            counter[c] = n
+        else:
+            del counter[c]
+
+    def _kind(self, p, k, c, sign):
+        kind = self.kinds[p][k]
+        kind[c] += sign
+        if kind[c] == (1 if sign > 0 else 0):
+            self.bits[p][c] ^= 1 << k
+            if self.bits[p][c]:
+                self.threat_cells[p].add(c)
+            else:
+                self.threat_cells[p].discard(c)
+            if DOUBLE_THREAT[self.bits[p][c]]:
+                self.doubles[p].add(c)
+            else:
+                self.doubles[p].discard(c)
+
+    def _window5(self, w, sign):
+        # add (sign = 1) or remove (sign = -1) the threats of a window of 5 cells
+        empty = self.empty5[w]
+        if empty != 1 and empty != 2:
+            return
+        for p in (1, 2):
+            if self.count5[p][w] + empty == 5:
+                gaps = [c for c in self.windows5[w] if self.cells[c] == 0]
+                if empty == 1:
+                    self._count(self.fives[p], gaps[0], sign)
+                else:
+                    for c in gaps:
+                        self._kind(p, self.dirs5[w], c, sign)
+
+    def _window6(self, w, sign):
+        # add (sign = 1) or remove (sign = -1) the threats of a window of 6 cells
+        empty = self.empty6[w]
+        if self.ends6[w] != 2 or (empty != 1 and empty != 2):
+            return
+        for p in (1, 2):
+            if self.count6[p][w] + empty == 4:
+                gaps = [c for c in self.windows6[w][1:5] if self.cells[c] == 0]
+                if empty == 1:
+                    self._count(self.open_fours[p], gaps[0], sign)
+                else:
+                    for c in gaps:
+                        self._kind(p, 4 + self.dirs6[w], c, sign)
+
+    def _set(self, c, value):
+        # only the windows with 1 or 2 empty cells (and empty ends) hold threats, so the others are skipped
+        old = self.cells[c]
+        windows5, windows6 = self.windows_of5[c], self.windows_of6[c]
+        empty5, empty6, ends6 = self.empty5, self.empty6, self.ends6
+        for w in windows5:
+            if 0 < empty5[w] < 3:
+                self._window5(w, -1)
+        for w in windows6:
+            if ends6[w] == 2 and 0 < empty6[w] < 3:
+                self._window6(w, -1)
+        self.cells[c] = value
+        for w in windows5:
+            if old == 0:
+                empty5[w] -= 1
+            elif old in self.count5:
+                self.count5[old][w] -= 1
+            if value == 0:
+                empty5[w] += 1
+            elif value in self.count5:
+                self.count5[value][w] += 1
+            if 0 < empty5[w] < 3:
+                self._window5(w, 1)
+        for w in windows6:
+            if c == self.windows6[w][0] or c == self.windows6[w][5]:
+                ends6[w] += (value == 0) - (old == 0)
+            else:
+                if old == 0:
+                    empty6[w] -= 1
+                elif old in self.count6:
+                    self.count6[old][w] -= 1
+                if value == 0:
+                    empty6[w] += 1
+                elif value in self.count6:
+                    self.count6[value][w] += 1
+            if ends6[w] == 2 and 0 < empty6[w] < 3:
+                self._window6(w, 1)
+
+    def make(self, x, y, player):
+        """place the stone of player on (x, y)"""
+        self._set(x * self.width + y, player)
+        self.moves.append((x, y))
+
+    def unmake(self):
+        """remove the last stone placed by make"""
+        x, y = self.moves.pop()
+        self._set(x * self.width + y, 0)
+
+    def cell(self, c):
+        return divmod(c, self.width)
+
+    def five(self, player):
+        """a cell where player completes five, or None"""
+        return self.cell(min(self.fives[player])) if self.fives[player] else None
+
+    def open_four(self, player):
+        """a cell where player makes an open four, or None"""
+        return self.cell(min(self.open_fours[player])) if self.open_fours[player] else None
+
+    def double_threat(self, player):
+        """a cell with two or more threat bits of player, or None"""
+        return self.cell(min(self.doubles[player])) if self.doubles[player] else None
+
+    def has_threats(self, player):
+        return bool(self.fives[player] or self.open_fours[player] or self.doubles[player])
+
+    def threat_action(self, player):
+        """
+        the heuristic chain of policy.threat_action without evaluating block points:
+        five, open four and double threat, each for player then the opponent
+        """
+        opponent = 3 - player
+        for query in (self.five, self.open_four, self.double_threat):
+            for p in (player, opponent):
+                action = query(p)
+                if action is not None:
+                    return action
+        return None
@@ -0,0 +1,200 @@
+"""
+Threat-space search: VCF (victory by continuous fours) and VCT (victory by continuous threats).
+
+The attacker only plays forcing moves, read from a ThreatIndex: in VCF the moves making a four,
+in VCT also the moves making an open three. The defender only plays the answers to them: the
+cell of a five threat, or, against an open three, the cells of its windows which leave the
+attacker without an open four, and its own fours. The tree stays narrow, so wins many plies
+ahead are found in little time.
+
+The search deepens by the number of attacker moves, VCF before VCT, and keeps the result of
+every attacker node in a transposition table keyed by the canonical hash (see SymmetricHash):
+the winning line of a won position, as cells of the canonical board, or the depth a position
+was searched to without finding one.
+"""
+import time
+from threats import ThreatIndex
+from zobrist import TranspositionTable, SymmetricHash
+
+
+# the bits of ThreatIndex.bits of the directions where a cell makes a four, and an open three
+FOUR_BITS = 0x0F
+THREE_BITS = 0xF0
+# the depth of a position searched through, without running into the depth limit
+EXHAUSTED = 1 << 30
+
+
+class ThreatSpaceSearch(object):
+    """
+    Threat-space search on one board, which is made and unmade in place.
+    """
+    ENTRY_BYTES = 320   # about the memory of one entry of the table, with its key and line
+
+    def __init__(self, board, tt_size=100000):
+        """
+        :param board: a 2-d list or BitBoard, which is not changed
+        :param tt_size: the number of positions kept in the transposition table
+        """
+        self.height, self.width = len(board), len(board[0])
+        self.index = ThreatIndex(board)
+        self.symmetry = SymmetricHash(board)
+        self.tt = TranspositionTable(tt_size, entry_bytes=self.ENTRY_BYTES)
+        self.deadline = None
+        self.timeout = False
+        self.cut = False    # whether the search ran into the depth limit
+        self.nodes = 0
+
+    def solve(self, player, deadline, max_vcf=10, max_vct=5):
+        """
+        search a forced win of player, who is to move
+        :param deadline: the time to give up by
+        :param max_vcf, max_vct: the most attacker moves of a VCF and a VCT, before the five
+        :return: the winning line, a list of moves of both sides starting with a move of player and
+            ending with the five, or None if no win is found; against several defences the line
+            follows the first one
+        """
+        self.deadline = deadline
+        self.timeout = False
+        for vct, max_depth in ((False, max_vcf), (True, max_vct)):
+            for depth in range(max_depth + 1):
+                self.cut = False
+                line = self._attack(player, depth, vct)
+                if line is not None:
+                    return [self.index.cell(c) for c in line]
+                if self.timeout:
+                    return None
+                if not self.cut:
+                    break   # nothing left to deepen
+        return None
+
+    def _make(self, c, player):
+        x, y = self.index.cell(c)
+        self.index.make(x, y, player)
+        self.symmetry.toggle(x, y, player)
+
+    def _unmake(self, c, player):
+        x, y = self.index.cell(c)
+        self.index.unmake()
+        self.symmetry.toggle(x, y, player)
+
+    def _threats(self, player, mask):
+        # the moves of player making a threat of mask, the strongest first
+        index = self.index
+        bits = index.bits[player]
+        cells = [c for c in index.threat_cells[player] if bits[c] & mask]
+        return sorted(cells, key=lambda c: (c not in index.open_fours[player], c not in index.doubles[player],
+                                            -bin(bits[c] & mask).count("1"), c))
+
+    def _attacks(self, attacker, vct):
+        # the moves of attacker to move, who has no five
+        index = self.index
+        defender = 3 - attacker
+        mask = FOUR_BITS | THREE_BITS if vct else FOUR_BITS
+        if len(index.fives[defender]) > 1:
+            return []
+        if index.fives[defender]:
+            # the five of the defender must be blocked, which only goes on if the block is a threat too
+            block = min(index.fives[defender])
+            return [block] if index.bits[attacker][block] & mask else []
+        return self._threats(attacker, mask)
+
+    def _attack(self, attacker, depth, vct):
+        # an OR node: the winning line of attacker to move, or None
+        index = self.index
+        if index.fives[attacker]:
+            return [min(index.fives[attacker])]
+        self.nodes += 1
+        if self.nodes & 63 == 0 and time.time() > self.deadline:
+            self.timeout = True
+        if self.timeout:
+            return None
+        h, t = self.symmetry.canonical()
+        key = (h, attacker, vct)
+        entry = self.tt.get(key)
+        if entry is not None:
+            searched, line = entry
+            if line is not None:
+                return [self.symmetry.inverse[t][c] for c in line]
+            if searched >= depth:
+                self.cut = self.cut or searched < EXHAUSTED
+                return None
+        if depth == 0:
+            self.cut = True
+            return None
+
+        moves = self._attacks(attacker, vct)
+        cut, self.cut = self.cut, False
+        line = None
+        for c in moves:
+            self._make(c, attacker)
+            try:
+                line = self._defend(attacker, depth - 1, vct)
+            finally:
+                self._unmake(c, attacker)
+            if line is not None:
+                line = [c] + line
+                break
+        if not self.timeout:
+            self.tt.put(key, (depth if self.cut else EXHAUSTED,
+                              None if line is None else [self.symmetry.perms[t][c] for c in line]))
+        self.cut = self.cut or cut
+        return line
+
+    def _defend(self, attacker, depth, vct):
+        # an AND node: the winning line of attacker against every defence, or None
+        index = self.index
+        defender = 3 - attacker
+        if index.fives[defender]:
+            return None     # the defender completes five first
+        fives = index.fives[attacker]
+        if len(fives) > 1:
+            block, five = sorted(fives)[:2]
+            return [block, five]
+        if fives:
+            replies = [min(fives)]
+        elif index.open_fours[attacker]:
+            replies, cells = self._defences(attacker)
+            if not replies:
+                return self._open_four_line(attacker, min(cells))
+        else:
+            return None     # not a threat
+
+        line = None
+        for r in replies:
+            self._make(r, defender)
+            try:
+                sub = self._attack(attacker, depth, vct)
+            finally:
+                self._unmake(r, defender)
+            if sub is None:
+                return None
+            if line is None:
+                line = [r] + sub
+        return line
+
+    def _defences(self, attacker):
+        # the moves against the open threes of attacker: the fours of the defender, and the cells in
+        # every open three window, which the stone of the defender kills all at once; and the cells
+        # of the windows
+        index = self.index
+        defender = 3 - attacker
+        cells, blocks = set(), None
+        for gap in index.open_fours[attacker]:
+            for w in index.windows_of6[gap]:
+                if index.ends6[w] == 2 and index.empty6[w] == 1 and index.count6[attacker][w] == 3:
+                    empty = {c for c in index.windows6[w] if index.cells[c] == 0}
+                    cells |= empty
+                    blocks = empty if blocks is None else blocks & empty
+        fours = self._threats(defender, FOUR_BITS)
+        return fours + sorted(blocks.difference(fours)), cells
+
+    def _open_four_line(self, attacker, reply):
+        # the end of a line against no defence: the reply, the open four, a block and the five
+        defender = 3 - attacker
+        self._make(reply, defender)
+        gap = min(self.index.open_fours[attacker])
+        self._make(gap, attacker)
+        block, five = sorted(self.index.fives[attacker])[:2]
+        self._unmake(gap, attacker)
+        self._unmake(reply, defender)
+        return [reply, gap, block, five]
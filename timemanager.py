@@ -0,0 +1,64 @@
+"""
+Time control of the brain.
+
+The manager tells the brain the time of one turn (info timeout_turn), of the whole match
+(info timeout_match) and the time left of the match (info time_left), all in milliseconds,
+with 0 meaning no limit for the match and "as fast as possible" for a turn. A move takes
+its share of the time left, but never more than a fraction of what the turn allows, so that an
+unstable position can be given more, and a safety margin is kept for the I/O with the manager.
+"""
+import time
+
+
+class TimeManager(object):
+    """
+    Deadlines of a move. start() is called when the turn begins; a search runs until
+    `deadline`, and may extend() it once, up to `limit`, when the position is unstable.
+    """
+    def __init__(self, margin=0.2, moves_to_go=25, instability=2., min_time=0.05):
+        """
+        :param margin: the seconds kept for the I/O with the manager
+        :param moves_to_go: the number of moves the time left of the match is shared by
+        :param instability: how many times the usual time an unstable position may take
+        :param min_time: the shortest time of a move in seconds
+        """
+        self.margin = margin
+        self.moves_to_go = moves_to_go
+        self.instability = instability
+        self.min_time = min_time
+        self.started = time.time()
+        self.deadline = self.started
+        self.limit = self.started
+        self.extended = False
+
+    def start(self, timeout_turn, timeout_match, time_left):
+        """
+        :param timeout_turn, timeout_match, time_left: the protocol's info values, in milliseconds
+        :return: the deadline of the move
+        """
+        self.started = time.time()
+        limit = timeout_turn / 1000. - self.margin if timeout_turn > 0 else self.min_time
+        share = limit / self.instability   # leaves room for extend()
+        if timeout_match > 0:
+            left = time_left / 1000. - self.margin
+            limit = min(limit, left)
+            share = min(share, left / self.moves_to_go)
+        limit = max(limit, self.min_time)
+        self.limit = self.started + limit
+        self.deadline = self.started + min(max(share, self.min_time), limit)
+        self.extended = False
+        return self.deadline
+
+    def extend(self):
+        """
+        give an unstable position more time, once per move
+        :return: whether the deadline was moved
+        """
+        if self.extended or self.deadline >= self.limit:
+            return False
+        self.deadline = min(self.limit, self.started + (self.deadline - self.started) * self.instability)
+        self.extended = True
+        return True
+
+    def remaining(self):
+        return self.deadline - time.time()
@@ -1,5 +1,5 @@
 import re
-from collections import Counter
+from collections import Counter, OrderedDict
 
 
 def extend_board(player, board):
@@ -16,170 +16,373 @@ def extend_board(player, board):
     return new_board
 
 
-def is_special_class(board, player):
+# special classes of chess and their patterns in a line, 1 for the stones of the player
+# Details in 'http://zjh776.iteye.com/blog/1979748'
+class_patterns = [(("WIN", (), ()), "11111"),
+                  (("H4", (0, 5), ()), "011110"),
+                  (("C4", (0), (5)), "011112"),
+                  (("C4", (0), (5)), "011113"),
+                  (("C4", (5), (0)), "211110"),
+                  (("C4", (5), (0)), "311110"),
+                  (("C4", (4), ()), r"^11110"),
+                  (("C4", (0), ()), r"01111$"),
+                  (("C4", (0, 2, 6), ()), "0101110"),
+                  (("C4", (0, 4, 6), ()), "0111010"),
+                  (("C4", (0, 3, 6), ()), "0110110"),
+                  (("H3", (0, 4), ()), "01110"),
+                  (("H3", (0, 2, 5), ()), "010110"),
+                  (("H3", (0, 3, 5), ()), "011010"),
+                  (("M3", (0, 1), (5)), "001112"),
+                  (("M3", (0, 1), (5)), "001113"),
+                  (("M3", (0, 1), ()), r"00111$"),
+                  (("M3", (4, 5), (0)), "211100"),
+                  (("M3", (4, 5), (0)), "311100"),
+                  (("M3", (4, 5), ()), r"^11100"),
+                  (("M3", (0, 2), (5)), "010112"),
+                  (("M3", (0, 2), (5)), "010113"),
+                  (("M3", (0, 2), ()), r"01011$"),
+                  (("M3", (3, 5), (0)), "211010"),
+                  (("M3", (3, 5), (0)), "311010"),
+                  (("M3", (3, 5), ()), r"^11010"),
+                  (("M3", (0, 3), (5)), "011012"),
+                  (("M3", (0, 3), (5)), "011013"),
+                  (("M3", (0, 3), ()), r"01101$"),
+                  (("M3", (2, 5), (0)), "210110"),
+                  (("M3", (2, 5), (0)), "310110"),
+                  (("M3", (2, 5), ()), r"^10110"),
+                  (("M3", (1, 2), ()), "10011"),
+                  (("M3", (2, 3), ()), "11001"),
+                  (("M3", (1, 3), ()), "10101"),
+                  (("M3", (1, 4), (0, 6)), "2011102"),
+                  (("M3", (1, 4), (0, 6)), "3011102"),
+                  (("M3", (1, 4), (0, 6)), "2011103"),
+                  (("M3", (1, 4), (6)), r"^011102"),
+                  (("M3", (1, 4), (6)), r"^011103"),
+                  (("M3", (1, 4), (0)), r"201110$"),
+                  (("M3", (1, 4), (0)), r"301110$"),
+                  (("H2", (0, 1, 4), ()), "00110"),
+                  (("H2", (0, 3, 4), ()), "01100"),
+                  (("H2", (0, 2, 4), ()), "01010"),
+                  (("H2", (0, 2, 3, 5), ()), "010010"),
+                  (("M2", (0, 1, 2), (5)), "000112"),
+                  (("M2", (0, 1, 2), (5)), "000113"),
+                  (("M2", (0, 1, 2), ()), r"00011$"),
+                  (("M2", (3, 4, 5), (0)), "211000"),
+                  (("M2", (3, 4, 5), (0)), "311000"),
+                  (("M2", (3, 4, 5), ()), r"^11000"),
+                  (("M2", (0, 1, 3), (5)), "001012"),
+                  (("M2", (0, 1, 3), (5)), "001013"),
+                  (("M2", (0, 1, 3), ()), r"00101$"),
+                  (("M2", (2, 4, 5), (0)), "210100"),
+                  (("M2", (2, 4, 5), (0)), "310100"),
+                  (("M2", (2, 4, 5), ()), r"^10100"),
+                  (("M2", (0, 2, 3), (5)), "010012"),
+                  (("M2", (0, 2, 3), ()), r"01001$"),
+                  (("M2", (2, 3, 5), (0)), "210010"),
+                  (("M2", (2, 3, 5), (0)), "310010"),
+                  (("M2", (2, 3, 5), ()), r"^10010"),
+                  (("M2", (1, 2, 3), ()), "10001"),
+                  (("M2", (1, 3, 5), (0, 6)), "2010102"),
+                  (("M2", (1, 3, 5), (0, 6)), "2010103"),
+                  (("M2", (1, 3, 5), (0, 6)), "3010102"),
+                  (("M2", (1, 3, 5), (0)), r"201010$"),
+                  (("M2", (1, 3, 5), (0)), r"301010$"),
+                  (("M2", (1, 3, 5), (6)), r"^010102"),
+                  (("M2", (1, 3, 5), (6)), r"^010103"),
+                  (("M2", (1, 4, 5), (0, 6)), "2011002"),
+                  (("M2", (1, 4, 5), (0, 6)), "2011003"),
+                  (("M2", (1, 4, 5), (0, 6)), "3011002"),
+                  (("M2", (1, 4, 5), (6)), r"^011002"),
+                  (("M2", (1, 4, 5), (6)), r"^011003"),
+                  (("M2", (1, 4, 5), (0)), r"201100^"),
+                  (("M2", (1, 4, 5), (0)), r"301100^"),
+                  (("M2", (1, 2, 5), (0, 6)), "2001102"),
+                  (("M2", (1, 2, 5), (0, 6)), "2001103"),
+                  (("M2", (1, 2, 5), (0, 6)), "3001102"),
+                  (("M2", (1, 2, 5), (0)), r"200110$"),
+                  (("M2", (1, 2, 5), (0)), r"300110$"),
+                  (("M2", (1, 2, 5), (6)), r"^001102"),
+                  (("M2", (1, 2, 5), (6)), r"^001103"),
+                  (("S4", (), (0, 5)), "211112"),
+                  (("S4", (), (0, 5)), "211113"),
+                  (("S4", (), (0, 5)), "311112"),
+                  (("S4", (), (0)), r"21111$"),
+                  (("S4", (), (0)), r"31111$"),
+                  (("S4", (), (5)), r"^11112"),
+                  (("S4", (), (5)), r"^11113"),
+                  (("S3", (), (0, 4)), "21112"),
+                  (("S3", (), (0, 4)), "21113"),
+                  (("S3", (), (0, 4)), "31112"),
+                  (("S3", (), (0)), r"2111$"),
+                  (("S3", (), (0)), r"3111$"),
+                  (("S3", (), (4)), r"^1112"),
+                  (("S3", (), (4)), r"^1113"),
+                  (("S2", (), (0, 3)), "2112"),
+                  (("S2", (), (0, 3)), "2113"),
+                  (("S2", (), (3)), r"^112"),
+                  (("S2", (), (3)), r"^113"),
+                  (("S2", (), (0)), r"211$"),
+                  (("S2", (), (0)), r"311$"),
+                  ]
+# the patterns as a dict, where a key given several patterns only keeps the last one
+class_dict = dict(class_patterns)
+
+
+class PatternMatcher(object):
     """
-    judge whether the several chess given in the list form a special class
-    :param
-        board: the board of gomoku
-        player: the index of color, 1: black, 2: white
+    Count the special classes of chess in a line in one pass.
+    Every window of WINDOW cells of the line is encoded as a number in base 5 (the 4 cell values,
+    and EDGE for the ends of the line, which stand for the anchors ^ and $ of the patterns). A
+    table indexed by this number gives the patterns starting at the window, and each pattern is
+    counted as re.findall does, i.e. without overlapping its previous occurrence.
+    """
+    EDGE = 4
+    WINDOW = 7
+
+    def __init__(self, patterns):
+        """
+        :param patterns: a list of (key, pattern), where key[0] is the class of the pattern
+        """
+        base = self.EDGE + 1
+        self.size = base ** self.WINDOW
+        self.classes = []
+        self.symbols = []
+        self.lengths = []
+        table = [()] * self.size
+        for key, pattern in patterns:
+            symbols = self._symbols(pattern)
+            if symbols is None:
+                continue
+            pid = len(self.classes)
+            self.classes.append(key[0])
+            self.symbols.append(tuple(symbols))
+            self.lengths.append(len(symbols))
+            code = 0
+            for symbol in symbols:
+                code = code * base + symbol
+            rest = base ** (self.WINDOW - len(symbols))
+            for tail in range(rest):
+                table[code * rest + tail] += (pid,)
+        self.table = table
+
+    def _symbols(self, pattern):
+        # the cell values of a pattern, with EDGE for its anchors, or None if it can never match
+        symbols = [int(c) for c in pattern.strip("^$") if c.isdigit()]
+        if len(symbols) != len(pattern.strip("^$")) or "^" in pattern[1:] or "$" in pattern[:-1]:
+            return None
+        if pattern.startswith("^"):
+            symbols.insert(0, self.EDGE)
+        if pattern.endswith("$"):
+            symbols.append(self.EDGE)
+        return symbols
+
+    def count(self, values):
+        """
+        :param values: the cell values of the line
+        :return: Counter: ({class: num of this class}, ...)
+        """
+        base = self.EDGE + 1
+        line = [self.EDGE]
+        line.extend(values)
+        line.extend([self.EDGE] * self.WINDOW)
+        table, lengths, size = self.table, self.lengths, self.size
+        next_start = [0] * len(lengths)
+        counts = [0] * len(lengths)
+        code = 0
+        for symbol in line[:self.WINDOW - 1]:
+            code = code * base + symbol
+        for i in range(len(values) + 1):
+            code = (code * base + line[i + self.WINDOW - 1]) % size
+            for pid in table[code]:
+                if i >= next_start[pid]:
+                    counts[pid] += 1
+                    next_start[pid] = i + lengths[pid]
+        class_counter = Counter()
+        for pid, num in enumerate(counts):
+            if num:
+                class_counter[self.classes[pid]] += num
+        return class_counter
+
+
+# built once at import: every listed pattern, and the patterns of class_dict only (the reference)
+pattern_matcher = PatternMatcher(class_patterns)
+reference_matcher = PatternMatcher(class_dict.items())
+
+
+def regex_class_counter(list_str, reference=False):
+    """
+    count the special classes of chess in one line with re.findall, kept to check PatternMatcher against
+    """
+    class_counter = Counter()
+    for key, pattern in class_dict.items() if reference else class_patterns:
+        class_counter[key[0]] += len(re.findall(pattern, list_str))
+    return class_counter
+
+
+class LineCache(object):
+    """
+    A bounded LRU cache from the content of a line, packed into an integer by pack_line, to its
+    Counter of special classes and its score for the stones of player 1.
+    """
+    SIZE = 200000
+    ENTRY_BYTES = 350   # about the memory of one entry, with its key, Counter and score
+
+    def __init__(self, maxsize=SIZE):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        self.entries[key] = entry
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)    # least recently used
+
+    def resize(self, maxsize):
+        self.maxsize = maxsize
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def nbytes(self):
+        return len(self.entries) * self.ENTRY_BYTES
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.,
+                "size": len(self.entries),
+                "maxsize": self.maxsize,
+                "bytes": self.nbytes()}
+
+
+line_cache = LineCache()
+
+
+def budget_line_cache(max_bytes):
+    """
+    size line_cache to take about max_bytes, or back to its default size for max_bytes 0
+    :return: the bytes the cache may take
+    """
+    if max_bytes > 0:
+        line_cache.resize(min(LineCache.SIZE, max(1024, max_bytes // LineCache.ENTRY_BYTES)))
+    else:
+        line_cache.resize(LineCache.SIZE)
+    return line_cache.maxsize * LineCache.ENTRY_BYTES
+
+
+def pack_line(values, reference=False):
+    """
+    pack the cell values of a line (2 bits each) and the pattern set into an integer
+    """
+    key = 1     # leading 1 to tell apart lines of different lengths
+    for v in values:
+        key = (key << 2) | v
+    return (key << 1) | reference
+
+
+def line_classes(values, reference=False):
+    """
+    count the special classes of chess in one line, through line_cache
+    :param values: the cell values of the line
+    :param reference: only count the patterns of class_dict, as the regex scan always did
     :return:
-        Counter: ({class: num of this class}, ...)
+        Counter: ({class: num of this class}, ...), shared with the cache and not to be changed
+        score: the score of these classes
+    """
+    key = pack_line(values, reference)
+    entry = line_cache.get(key)
+    if entry is None:
+        matcher = reference_matcher if reference else pattern_matcher
+        class_counter = matcher.count(values)
+        score_map = class_to_score()
+        score = 0
+        for a_class, num in class_counter.items():
+            score = score + score_map[a_class] * num
+        entry = (class_counter, score)
+        line_cache.put(key, entry)
+    return entry
+
+
+def line_class_counter(list_str, reference=False):
     """
+    count the special classes of chess in one line
+    :param list_str: the line as a string of cell values
+    :param reference: only count the patterns of class_dict, as the regex scan always did
+    :return: Counter: ({class: num of this class}, ...)
+    """
+    return Counter(line_classes([int(c) for c in list_str], reference)[0])
 
-    # Details in 'http://zjh776.iteye.com/blog/1979748'
 
-    def _black_color(board):
-        height, width = len(board), len(board[0])
-        for i in range(height):
-            for j in range(width):
-                board[i][j] = (3 - board[i][j]) % 3
-        return board
+def black_color(board):
+    """
+    swap the colors of the board in place, seeing the stones of player 2 as the stones of player 1
+    """
+    height, width = len(board), len(board[0])
+    for i in range(height):
+        for j in range(width):
+            board[i][j] = (3 - board[i][j]) % 3
+    return board
 
-    if player == 2:
-        list_str = _black_color(board)
-
-    class_dict = {("WIN", (), ()): "11111",
-                  ("H4", (0, 5), ()): "011110",
-                  ("C4", (0), (5)): "011112",
-                  ("C4", (0), (5)): "011113",
-                  ("C4", (5), (0)): "211110",
-                  ("C4", (5), (0)): "311110",
-                  ("C4", (4), ()): r"^11110",
-                  ("C4", (0), ()): r"01111$",
-                  ("C4", (0, 2, 6), ()): "0101110",
-                  ("C4", (0, 4, 6), ()): "0111010",
-                  ("C4", (0, 3, 6), ()): "0110110",
-                  ("H3", (0, 4), ()): "01110",
-                  ("H3", (0, 2, 5), ()): "010110",
-                  ("H3", (0, 3, 5), ()): "011010",
-                  ("M3", (0, 1), (5)): "001112",
-                  ("M3", (0, 1), (5)): "001113",
-                  ("M3", (0, 1), ()): r"00111$",
-                  ("M3", (4, 5), (0)): "211100",
-                  ("M3", (4, 5), (0)): "311100",
-                  ("M3", (4, 5), ()): r"^11100",
-                  ("M3", (0, 2), (5)): "010112",
-                  ("M3", (0, 2), (5)): "010113",
-                  ("M3", (0, 2), ()): r"01011$",
-                  ("M3", (3, 5), (0)): "211010",
-                  ("M3", (3, 5), (0)): "311010",
-                  ("M3", (3, 5), ()): r"^11010",
-                  ("M3", (0, 3), (5)): "011012",
-                  ("M3", (0, 3), (5)): "011013",
-                  ("M3", (0, 3), ()): r"01101$",
-                  ("M3", (2, 5), (0)): "210110",
-                  ("M3", (2, 5), (0)): "310110",
-                  ("M3", (2, 5), ()): r"^10110",
-                  ("M3", (1, 2), ()): "10011",
-                  ("M3", (2, 3), ()): "11001",
-                  ("M3", (1, 3), ()): "10101",
-                  ("M3", (1, 4), (0, 6)): "2011102",
-                  ("M3", (1, 4), (0, 6)): "3011102",
-                  ("M3", (1, 4), (0, 6)): "2011103",
-                  ("M3", (1, 4), (6)): r"^011102",
-                  ("M3", (1, 4), (6)): r"^011103",
-                  ("M3", (1, 4), (0)): r"201110$",
-                  ("M3", (1, 4), (0)): r"301110$",
-                  ("H2", (0, 1, 4), ()): "00110",
-                  ("H2", (0, 3, 4), ()): "01100",
-                  ("H2", (0, 2, 4), ()): "01010",
-                  ("H2", (0, 2, 3, 5), ()): "010010",
-                  ("M2", (0, 1, 2), (5)): "000112",
-                  ("M2", (0, 1, 2), (5)): "000113",
-                  ("M2", (0, 1, 2), ()): r"00011$",
-                  ("M2", (3, 4, 5), (0)): "211000",
-                  ("M2", (3, 4, 5), (0)): "311000",
-                  ("M2", (3, 4, 5), ()): r"^11000",
-                  ("M2", (0, 1, 3), (5)): "001012",
-                  ("M2", (0, 1, 3), (5)): "001013",
-                  ("M2", (0, 1, 3), ()): r"00101$",
-                  ("M2", (2, 4, 5), (0)): "210100",
-                  ("M2", (2, 4, 5), (0)): "310100",
-                  ("M2", (2, 4, 5), ()): r"^10100",
-                  ("M2", (0, 2, 3), (5)): "010012",
-                  ("M2", (0, 2, 3), ()): r"01001$",
-                  ("M2", (2, 3, 5), (0)): "210010",
-                  ("M2", (2, 3, 5), (0)): "310010",
-                  ("M2", (2, 3, 5), ()): r"^10010",
-                  ("M2", (1, 2, 3), ()): "10001",
-                  ("M2", (1, 3, 5), (0, 6)): "2010102",
-                  ("M2", (1, 3, 5), (0, 6)): "2010103",
-                  ("M2", (1, 3, 5), (0, 6)): "3010102",
-                  ("M2", (1, 3, 5), (0)): r"201010$",
-                  ("M2", (1, 3, 5), (0)): r"301010$",
-                  ("M2", (1, 3, 5), (6)): r"^010102",
-                  ("M2", (1, 3, 5), (6)): r"^010103",
-                  ("M2", (1, 4, 5), (0, 6)): "2011002",
-                  ("M2", (1, 4, 5), (0, 6)): "2011003",
-                  ("M2", (1, 4, 5), (0, 6)): "3011002",
-                  ("M2", (1, 4, 5), (6)): r"^011002",
-                  ("M2", (1, 4, 5), (6)): r"^011003",
-                  ("M2", (1, 4, 5), (0)): r"201100^",
-                  ("M2", (1, 4, 5), (0)): r"301100^",
-                  ("M2", (1, 2, 5), (0, 6)): "2001102",
-                  ("M2", (1, 2, 5), (0, 6)): "2001103",
-                  ("M2", (1, 2, 5), (0, 6)): "3001102",
-                  ("M2", (1, 2, 5), (0)): r"200110$",
-                  ("M2", (1, 2, 5), (0)): r"300110$",
-                  ("M2", (1, 2, 5), (6)): r"^001102",
-                  ("M2", (1, 2, 5), (6)): r"^001103",
-                  ("S4", (), (0, 5)): "211112",
-                  ("S4", (), (0, 5)): "211113",
-                  ("S4", (), (0, 5)): "311112",
-                  ("S4", (), (0)): r"21111$",
-                  ("S4", (), (0)): r"31111$",
-                  ("S4", (), (5)): r"^11112",
-                  ("S4", (), (5)): r"^11113",
-                  ("S3", (), (0, 4)): "21112",
-                  ("S3", (), (0, 4)): "21113",
-                  ("S3", (), (0, 4)): "31112",
-                  ("S3", (), (0)): r"2111$",
-                  ("S3", (), (0)): r"3111$",
-                  ("S3", (), (4)): r"^1112",
-                  ("S3", (), (4)): r"^1113",
-                  ("S2", (), (0, 3)): "2112",
-                  ("S2", (), (0, 3)): "2113",
-                  ("S2", (), (3)): r"^112",
-                  ("S2", (), (3)): r"^113",
-                  ("S2", (), (0)): r"211$",
-                  ("S2", (), (0)): r"311$",
-                  }
 
+def board_line_values(board):
+    """
+    generate the cell values of every row, column and diagonal of the board
+    """
     height, width = len(board), len(board[0])
-    class_counter = Counter()
 
     # scan by row
     for row_idx, row in enumerate(board):
-        list_str = "".join(map(str, row))
-        for key in class_dict:
-            class_counter[key[0]] += len(re.findall(class_dict[key], list_str))
+        yield row
 
     # scan by col
     for col_idx in range(width):
-        col = [a[col_idx] for a in board]
-        list_str = "".join(map(str, col))
-        for key in class_dict:
-            class_counter[key[0]] += len(re.findall(class_dict[key], list_str))
+        yield [a[col_idx] for a in board]
 
     # scan by diag_1, from TL to BR
     for dist in range(-width + 1, height):
         row_ini, col_ini = (0, -dist) if dist < 0 else (dist, 0)
-        diag = [board[i][j] for i in range(
+        yield [board[i][j] for i in range(
             row_ini, height) for j in range(col_ini, width) if i - j == dist]
-        list_str = "".join(map(str, diag))
-        for key in class_dict:
-            class_counter[key[0]] += len(re.findall(class_dict[key], list_str))
 
     # scan by diag_2, from BL to TR
     for dist in range(0, width + height - 1):
         row_ini, col_ini = (dist, 0) if dist < height else (
             height - 1, dist - height + 1)
-        diag = [board[i][j] for i in range(
+        yield [board[i][j] for i in range(
             row_ini, -1, -1) for j in range(col_ini, width) if i + j == dist]
-        list_str = "".join(map(str, diag))
-        for key in class_dict:
-            class_counter[key[0]] += len(re.findall(class_dict[key], list_str))
 
+
+def is_special_class(board, player, reference=False):
+    """
+    judge whether the several chess given in the list form a special class
+    :param
+        board: the board of gomoku
+        player: the index of color, 1: black, 2: white
+        reference: only count the patterns of class_dict, as the regex scan always did
+    :return:
+        Counter: ({class: num of this class}, ...)
+    """
+    if player == 2:
+        board = black_color(board)
+
+    class_counter = Counter()
+    for values in board_line_values(board):
+        class_counter.update(line_classes(values, reference)[0])
     return class_counter
 
 
@@ -203,28 +406,118 @@ def class_to_score():
     return score_map
 
 
-def board_evaluation(board, player):
+def board_evaluation(board, player, reference=False):
     """
     evaluate the situation of the brain.
     :param
         board:
+        reference: only count the patterns of class_dict, as the regex scan always did
     :return:
         score: a real number, indicating how good the condition is
     """
     score = 0
 
     brain_board = extend_board(board=board, player=player)
-    for a_class, num in is_special_class(brain_board, 1).items():
-        score = score + class_to_score()[a_class] * num
+    for values in board_line_values(brain_board):
+        score = score + line_classes(values, reference)[1]
 
     opp = 3 - player
-    oppo_board = extend_board(board=board, player=opp)
-    for a_class, num in is_special_class(oppo_board, 2).items():
-        score = score - class_to_score()[a_class] * num
+    oppo_board = black_color(extend_board(board=board, player=opp))
+    for values in board_line_values(oppo_board):
+        score = score - line_classes(values, reference)[1]
 
     return score
 
 
+_board_lines = dict()
+
+
+def board_lines(size):
+    """
+    find the lines scanned by board_evaluation on the extended board of a size x size board
+    :return:
+        lines: a list of lines in the order is_special_class scans them, each a tuple of the
+               coordinates of its cells, None for the cells of the edge added by extend_board
+        lines_of: a map from the coordinate of a cell to the indices of the 4 lines through it
+    """
+    if size not in _board_lines:
+        n = size + 2
+
+        def _cell(i, j):
+            # extend_board puts board[x][y] on new_board[y + 1][x + 1]
+            return (j - 1, i - 1) if 0 < i < n - 1 and 0 < j < n - 1 else None
+
+        lines = []
+        # row
+        for i in range(n):
+            lines.append(tuple(_cell(i, j) for j in range(n)))
+        # col
+        for j in range(n):
+            lines.append(tuple(_cell(i, j) for i in range(n)))
+        # diag_1, from TL to BR
+        for dist in range(-n + 1, n):
+            lines.append(tuple(_cell(i, i - dist) for i in range(max(dist, 0), min(n, n + dist))))
+        # diag_2, from BL to TR
+        for dist in range(0, 2 * n - 1):
+            lines.append(tuple(_cell(i, dist - i) for i in range(min(dist, n - 1), max(dist - n + 1, 0) - 1, -1)))
+
+        lines_of = dict()
+        for idx, line in enumerate(lines):
+            for cell in line:
+                if cell is not None:
+                    lines_of.setdefault(cell, []).append(idx)
+        _board_lines[size] = (lines, lines_of)
+    return _board_lines[size]
+
+
+class BoardEvaluator(object):
+    """
+    Incremental version of board_evaluation.
+    The score of a board is a sum over the lines scanned by is_special_class, and a stone only
+    changes the 4 lines through its cell. So the score of every line is cached, and a move is
+    evaluated by scanning these 4 lines again.
+    """
+    def __init__(self, board, reference=False):
+        self.board = board
+        self.reference = reference
+        self.lines, self.lines_of = board_lines(len(board))
+        self.line_scores = [self.line_score(line) for line in self.lines]
+        self.score = sum(self.line_scores)
+
+    def line_score(self, line):
+        """
+        the part of board_evaluation contributed by one line
+        """
+        board = self.board
+        values = [3 if cell is None else board[cell[0]][cell[1]] for cell in line]
+        score = line_classes(values, self.reference)[1]
+        # the stones of player 2 seen as the stones of player 1, as black_color does
+        score -= line_classes([(3 - v) % 3 for v in values], self.reference)[1]
+        return score
+
+    def evaluate_move(self, x, y, player):
+        """
+        :return: board_evaluation(board, player) for the board with the stone of player placed on (x, y)
+        """
+        board = self.board
+        old = board[x][y]
+        board[x][y] = player
+        score = self.score
+        for idx in self.lines_of[(x, y)]:
+            score += self.line_score(self.lines[idx]) - self.line_scores[idx]
+        board[x][y] = old
+        return score
+
+    def update(self, x, y):
+        """
+        rescan the lines through (x, y) after the cell has been changed on the board
+        """
+        for idx in self.lines_of[(x, y)]:
+            line_score = self.line_score(self.lines[idx])
+            self.score += line_score - self.line_scores[idx]
+            self.line_scores[idx] = line_score
+
+
 def adjacent_moves(moved):
     """
     find the neighbors of the moved
@@ -320,3 +613,97 @@ def adjacent_2_moves(moved):
     adjacent = list(set(adjacent) - set(moved))
 
     return adjacent
+
+
+class CellSet(object):
+    """
+    A set of cells which is also a list, so that it can be iterated and sampled by random.choice
+    without copying. Removing swaps the last cell into the place of the removed one.
+    """
+    def __init__(self):
+        self.items = []
+        self.position = dict()
+
+    def add(self, cell):
+        if cell not in self.position:
+            self.position[cell] = len(self.items)
+            self.items.append(cell)
+
+    def discard(self, cell):
+        idx = self.position.pop(cell, None)
+        if idx is not None:
+            last = self.items.pop()
+            if idx < len(self.items):
+                self.items[idx] = last
+                self.position[last] = idx
+
+    def __contains__(self, cell):
+        return cell in self.position
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __getitem__(self, idx):
+        return self.items[idx]
+
+
+class Frontier(object):
+    """
+    The empty neighbors of the stones, as adjacent_moves (radius 1) and adjacent_2_moves (radius 2)
+    find them, kept up to date move by move. Every cell counts the stones among its neighbors,
+    so a move or its undo only updates the 16 neighbors of its cell.
+    """
+    OFFSETS_1 = ((1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (-1, 1), (1, -1), (-1, -1))
+    OFFSETS_2 = OFFSETS_1 + tuple((2 * dx, 2 * dy) for dx, dy in OFFSETS_1)
+
+    def __init__(self, board):
+        self.height, self.width = len(board), len(board[0])
+        self.stones = [[board[x][y] > 0 for y in range(self.width)] for x in range(self.height)]
+        self.counts = {1: [[0] * self.width for _ in range(self.height)],
+                       2: [[0] * self.width for _ in range(self.height)]}
+        self.near = {1: CellSet(), 2: CellSet()}
+        for x in range(self.height):
+            for y in range(self.width):
+                if self.stones[x][y]:
+                    self._update(x, y, 1)
+
+    def _neighbors(self, x, y, offsets):
+        for dx, dy in offsets:
+            if 0 <= x + dx < self.height and 0 <= y + dy < self.width:
+                yield x + dx, y + dy
+
+    def _update(self, x, y, sign):
+        for radius, offsets in ((1, self.OFFSETS_1), (2, self.OFFSETS_2)):
+            counts, near = self.counts[radius], self.near[radius]
+            for nx, ny in self._neighbors(x, y, offsets):
+                counts[nx][ny] += sign
+                if not self.stones[nx][ny]:
+                    if counts[nx][ny] > 0:
+                        near.add((nx, ny))
+                    else:
+                        near.discard((nx, ny))
+
+    def make(self, x, y):
+        """a stone is placed on (x, y)"""
+        self.stones[x][y] = True
+        for radius in (1, 2):
+            self.near[radius].discard((x, y))
+        self._update(x, y, 1)
+
+    def unmake(self, x, y):
+        """the stone on (x, y) is removed"""
+        self._update(x, y, -1)
+        self.stones[x][y] = False
+        for radius in (1, 2):
+            if self.counts[radius][x][y] > 0:
+                self.near[radius].add((x, y))
+
+    def candidates(self, radius=2):
+        """
+        the empty cells next to the stones, as a CellSet which changes with the next move:
+        copy it before making moves while iterating over it
+        """
+        return self.near[radius]
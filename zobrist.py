@@ -0,0 +1,242 @@
+"""
+Zobrist hashing of positions and a bounded transposition table.
+
+The hash of a board is the xor of one random 64-bit key per occupied cell and value, so a
+move updates it with a single xor. The keys are drawn from a generator seeded by the board
+size, so hashes are the same in every process and every run.
+
+The rotations and reflections of a board are equivalent positions. SymmetricHash keeps the hash
+of the board seen through each of them, and the smallest is its canonical hash.
+"""
+import random
+from collections import OrderedDict
+
+
+_keys = dict()
+
+
+def zobrist_keys(height, width):
+    """
+    :return:
+        keys: keys[x][y][v] for the value v (1, 2 or 3) on (x, y), keys[x][y][0] is 0
+        side: the key xor-ed in when player 2 is to move
+    """
+    if (height, width) not in _keys:
+        rng = random.Random("zobrist {}x{}".format(height, width))
+        keys = [[[0] + [rng.getrandbits(64) for v in range(3)] for y in range(width)] for x in range(height)]
+        _keys[(height, width)] = (keys, rng.getrandbits(64))
+    return _keys[(height, width)]
+
+
+def board_hash(board):
+    """
+    the hash of the stones on the board, without the side to move
+    """
+    keys, side = zobrist_keys(len(board), len(board[0]))
+    h = 0
+    for x, row in enumerate(board):
+        for y, v in enumerate(row):
+            if v:
+                h ^= keys[x][y][v]
+    return h
+
+
+_symmetries = dict()
+
+
+def symmetries(height, width):
+    """
+    the symmetries of the board: the 8 rotations and reflections of a square board, or the 4
+    reflections of another one, as maps of the cells numbered x * width + y
+    :return:
+        perms: perms[t][c] the cell c is moved to by the symmetry t, the identity being t = 0
+        inverse: inverse[t][c] the cell moved to c by the symmetry t
+    """
+    if (height, width) not in _symmetries:
+        maps = [lambda x, y: (x, y),
+                lambda x, y: (x, width - 1 - y),
+                lambda x, y: (height - 1 - x, y),
+                lambda x, y: (height - 1 - x, width - 1 - y)]
+        if height == width:
+            maps += [lambda x, y: (y, x),
+                     lambda x, y: (y, height - 1 - x),
+                     lambda x, y: (width - 1 - y, x),
+                     lambda x, y: (width - 1 - y, height - 1 - x)]
+        perms, inverse = [], []
+        for f in maps:
+            perm = [0] * (height * width)
+            for x in range(height):
+                for y in range(width):
+                    i, j = f(x, y)
+                    perm[x * width + y] = i * width + j
+            back = [0] * len(perm)
+            for c, d in enumerate(perm):
+                back[d] = c
+            perms.append(perm)
+            inverse.append(back)
+        _symmetries[(height, width)] = (perms, inverse)
+    return _symmetries[(height, width)]
+
+
+_symmetric_keys = dict()
+
+
+def symmetric_keys(height, width):
+    """
+    :return: keys[t][c][v], the key of the value v on the cell c seen through the symmetry t
+    """
+    if (height, width) not in _symmetric_keys:
+        keys, _ = zobrist_keys(height, width)
+        flat = [keys[x][y] for x in range(height) for y in range(width)]
+        _symmetric_keys[(height, width)] = [[flat[d] for d in perm] for perm in symmetries(height, width)[0]]
+    return _symmetric_keys[(height, width)]
+
+
+class SymmetricHash(object):
+    """
+    The Zobrist hashes of a board under all its symmetries, kept up to date move by move; the
+    smallest one is the canonical hash, the same for all the symmetric boards. The symmetry t
+    giving it maps the moves of the board to the moves of the canonical board, so that entries
+    keyed by the canonical hash keep their moves in its orientation.
+    """
+    def __init__(self, board):
+        self.height, self.width = len(board), len(board[0])
+        self.perms, self.inverse = symmetries(self.height, self.width)
+        _, self.side = zobrist_keys(self.height, self.width)
+        self.keys = symmetric_keys(self.height, self.width)
+        self.hashes = [0] * len(self.perms)
+        for x, row in enumerate(board):
+            for y, v in enumerate(row):
+                if v:
+                    self.toggle(x, y, v)
+
+    def toggle(self, x, y, v):
+        """
+        place or remove the value v on (x, y)
+        """
+        c = x * self.width + y
+        hashes = self.hashes
+        for t, keys in enumerate(self.keys):
+            hashes[t] ^= keys[c][v]
+
+    def canonical(self):
+        """
+        :return: the canonical hash, and the symmetry t giving it
+        """
+        h = min(self.hashes)
+        return h, self.hashes.index(h)
+
+    def child(self, x, y, v):
+        """
+        :return: the canonical hash and symmetry after placing v on (x, y), without placing it
+        """
+        c = x * self.width + y
+        hashes = [h ^ keys[c][v] for h, keys in zip(self.hashes, self.keys)]
+        h = min(hashes)
+        return h, hashes.index(h)
+
+    def to_canonical(self, move, t):
+        """
+        the move of the canonical board for the move of the board, with t from canonical()
+        """
+        x, y = move
+        return divmod(self.perms[t][x * self.width + y], self.width)
+
+    def from_canonical(self, move, t):
+        """
+        the move of the board for the move of the canonical board
+        """
+        x, y = move
+        return divmod(self.inverse[t][x * self.width + y], self.width)
+
+
+class TranspositionTable(object):
+    """
+    A bounded map from position hashes to search entries (MCTS nodes, bounds, ...).
+    When the table is full, the replacement policy picks the entry to drop:
+        "lru": the least recently used entry
+        "visits": the entry with the fewest visits among the `sample` least recently used ones,
+                  so that well explored nodes stay; visits(entry) gives the visits of an entry,
+                  by default its `visits` attribute
+    entry_bytes is about the memory of one entry, for the tables whose entries are larger than a
+    node id.
+    """
+    ENTRY_BYTES = 176   # about the memory of one entry, an OrderedDict item with a 64-bit key and an int
+
+    def __init__(self, maxsize=200000, replacement="lru", sample=8, visits=None, entry_bytes=ENTRY_BYTES):
+        if replacement not in ("lru", "visits"):
+            raise ValueError("unknown replacement policy {}".format(replacement))
+        self.maxsize = maxsize
+        self.replacement = replacement
+        self.sample = sample
+        self.visits = visits if visits is not None else lambda entry: getattr(entry, "visits", 0)
+        self.entry_bytes = entry_bytes
+        self.entries = OrderedDict()
+        self.lookups = 0
+        self.hits = 0
+
+    def get(self, key):
+        self.lookups += 1
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+        elif len(self.entries) >= self.maxsize:
+            self._evict()
+        self.entries[key] = entry
+
+    def _evict(self):
+        if self.replacement == "visits":
+            oldest = []
+            for key in self.entries:
+                oldest.append(key)
+                if len(oldest) >= self.sample:
+                    break
+            victim = min(oldest, key=lambda k: self.visits(self.entries[k]))
+            del self.entries[victim]
+        else:
+            self.entries.popitem(last=False)
+
+    def remap(self, new_entry):
+        """
+        replace every entry by new_entry(entry), dropping the entries it maps to None
+        """
+        entries = OrderedDict()
+        for key, entry in self.entries.items():
+            entry = new_entry(entry)
+            if entry is not None:
+                entries[key] = entry
+        self.entries = entries
+
+    def resize(self, maxsize):
+        self.maxsize = maxsize
+        while len(self.entries) > maxsize:
+            self._evict()
+
+    def clear(self):
+        self.entries.clear()
+        self.lookups = 0
+        self.hits = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def nbytes(self):
+        return len(self.entries) * self.entry_bytes
+
+    def hit_rate(self):
+        return self.hits / self.lookups if self.lookups else 0.
+
+    def stats(self):
+        return {"lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": self.hit_rate(),
+                "size": len(self.entries),
+                "maxsize": self.maxsize,
+                "bytes": self.nbytes(),
+                "replacement": self.replacement}